@@ -1,4 +1,4 @@
-from database import Database
+from database import Database, AnalyticsDatabase
 from datetime import datetime, timedelta
 from typing import Dict, List
 import json
@@ -6,6 +6,7 @@ import json
 class AdminUtils:
     def __init__(self):
         self.db = Database()
+        self.analytics = AnalyticsDatabase(self.db.db_path)
     
     def get_bot_statistics(self) -> Dict:
         total_users = self.get_total_users()
@@ -18,6 +19,7 @@ class AdminUtils:
             'total_anime': total_anime,
             'total_parts': total_parts,
             'total_groups': total_groups,
+            'cache': self.db.get_cache_stats(),
             'timestamp': datetime.now().isoformat()
         }
     
@@ -47,11 +49,10 @@ class AdminUtils:
             conn.close()
     
     def get_most_viewed_anime(self, limit: int = 10) -> List[Dict]:
-        conn = __import__('sqlite3').connect(self.db.db_path)
-        conn.row_factory = __import__('sqlite3').Row
-        cursor = conn.cursor()
-        
-        try:
+        with self.analytics.connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = __import__('sqlite3').Row
+            
             cursor.execute('''
                 SELECT a.code, a.description, COUNT(uh.id) as view_count
                 FROM anime a
@@ -61,8 +62,6 @@ class AdminUtils:
                 LIMIT ?
             ''', (limit,))
             return [dict(row) for row in cursor.fetchall()]
-        finally:
-            conn.close()
     
     def get_anime_details(self, code: int) -> Dict:
         anime = self.db.get_anime_by_code(code)
@@ -97,11 +96,14 @@ class AdminUtils:
     
     def export_anime_list(self, output_file: str = 'anime_list.json'):
         all_anime = self.db.get_all_anime()
+        codes = [anime['code'] for anime in all_anime]
+        parts_by_code = self.db.get_anime_parts_by_codes(codes)
+        groups_by_code = self.db.get_anime_groups_by_codes(codes)
         
         anime_list = []
         for anime in all_anime:
-            parts = self.db.get_anime_parts(anime['code'])
-            groups = self.db.get_anime_groups(anime['code'])
+            parts = parts_by_code.get(anime['code'], [])
+            groups = groups_by_code.get(anime['code'], [])
             
             anime_list.append({
                 'code': anime['code'],
@@ -120,36 +122,25 @@ class AdminUtils:
         with open(input_file, 'r', encoding='utf-8') as f:
             anime_list = json.load(f)
         
-        count = 0
-        for anime_data in anime_list:
-            try:
-                code = anime_data.get('code')
-                if not code:
-                    continue
-                
-                if self.db.get_anime_by_code(code):
-                    continue
-                
-                description = anime_data.get('description', '')
-                
-                self.db.add_anime(
-                    code=code,
-                    description=description,
-                    photo_id=None,
-                    parts=[]
-                )
-                count += 1
-            except Exception as e:
-                print(f"Error importing anime {anime_data}: {e}")
+        items = [
+            {'code': anime_data.get('code'), 'description': anime_data.get('description', '')}
+            for anime_data in anime_list
+            if anime_data.get('code')
+        ]
+        
+        results = self.db.add_anime_bulk(items)
         
-        return count
+        for result in results:
+            if not result['ok'] and result['error'] != 'already exists':
+                print(f"Error importing anime {result['code']}: {result['error']}")
+        
+        return sum(1 for result in results if result['ok'])
     
     def get_user_activity_report(self, days: int = 30) -> Dict:
-        conn = __import__('sqlite3').connect(self.db.db_path)
-        conn.row_factory = __import__('sqlite3').Row
-        cursor = conn.cursor()
-        
-        try:
+        with self.analytics.connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = __import__('sqlite3').Row
+            
             since_date = (datetime.now() - timedelta(days=days)).isoformat()
             
             cursor.execute('''
@@ -173,10 +164,9 @@ class AdminUtils:
             return {
                 'period_days': days,
                 'active_users': active_users,
-                'daily_activity': activity
+                'daily_activity': activity,
+                'snapshot_age': self.analytics.snapshot_age()
             }
-        finally:
-            conn.close()
     
     def cleanup_old_data(self, days: int = 90):
         conn = __import__('sqlite3').connect(self.db.db_path)
@@ -197,31 +187,33 @@ class AdminUtils:
         finally:
             conn.close()
     
-    def get_group_statistics(self) -> List[Dict]:
-        groups = self.db.get_all_groups()
-        
+    def get_group_statistics(self) -> Dict:
         stats = []
-        for group in groups:
-            conn = __import__('sqlite3').connect(self.db.db_path)
+        with self.analytics.connection() as conn:
             cursor = conn.cursor()
+            cursor.row_factory = __import__('sqlite3').Row
+            
+            cursor.execute('SELECT id, link, name, created_at FROM groups ORDER BY created_at DESC')
+            groups = cursor.fetchall()
             
-            try:
+            for group in groups:
                 cursor.execute(
                     'SELECT COUNT(*) FROM anime_groups WHERE group_id = ?',
                     (group['id'],)
                 )
                 anime_count = cursor.fetchone()[0]
-            finally:
-                conn.close()
-            
-            stats.append({
-                'name': group['name'],
-                'link': group['link'],
-                'anime_count': anime_count,
-                'created_at': group['created_at']
-            })
+                
+                stats.append({
+                    'name': group['name'],
+                    'link': group['link'],
+                    'anime_count': anime_count,
+                    'created_at': group['created_at']
+                })
         
-        return stats
+        return {
+            'groups': stats,
+            'snapshot_age': self.analytics.snapshot_age()
+        }
     
     def add_manga_channel(self, channel_id: str, link: str, name: str):
         self.db.add_mandatory_channel(channel_id, link, name)
@@ -238,6 +230,8 @@ class AdminUtils:
             conn.commit()
         finally:
             conn.close()
+        
+        self.db.invalidate_mandatory_channels()
     
     def get_user_info(self, user_id: int) -> Dict:
         conn = __import__('sqlite3').connect(self.db.db_path)
@@ -282,15 +282,7 @@ Jami foydalanuvchilar: {len(users)}
         return ConversationHandler.END
     
     def get_all_users(self) -> list:
-        conn = __import__('sqlite3').connect(self.db.db_path)
-        conn.row_factory = __import__('sqlite3').Row
-        cursor = conn.cursor()
-        
-        try:
-            cursor.execute('SELECT * FROM users ORDER BY created_at DESC')
-            return [dict(row) for row in cursor.fetchall()]
-        finally:
-            conn.close()
+        return self.db.get_all_users()
 
 class UserManagementPanel:
     def __init__(self):
@@ -332,17 +324,6 @@ class ModeratorPanel:
         cursor = conn.cursor()
         
         try:
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS anime_reports (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    anime_code INTEGER NOT NULL,
-                    reason TEXT,
-                    reported_by INTEGER,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    status TEXT DEFAULT 'pending'
-                )
-            ''')
-            
             cursor.execute('''
                 INSERT INTO anime_reports (anime_code, reason, reported_by)
                 VALUES (?, ?, ?)
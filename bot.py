@@ -1,12 +1,22 @@
+import html
 import logging
 import os
 import re
+import time
 from datetime import datetime
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, ReplyKeyboardRemove
+from typing import NamedTuple, Optional
+from telegram import (
+    Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, ReplyKeyboardRemove,
+    InlineQueryResultArticle, InlineQueryResultCachedPhoto, InputTextMessageContent
+)
 from telegram.constants import ParseMode
-from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, ConversationHandler, filters, ContextTypes
+from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, ChatMemberHandler, InlineQueryHandler, ConversationHandler, filters, ContextTypes
 from telegram.error import TelegramError
-from database import Database
+from cache import LRUCache, SingleFlight
+from database import Database, AsyncDatabase
+from middleware import CodeMissGuard
+from search_index import search_key
+from subscription import subscription_gate, matches_chat, MEMBER_STATUSES
 from config import *
 
 logging.basicConfig(
@@ -15,7 +25,37 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-db = Database()
+db = AsyncDatabase(Database())
+subscription_gate.attach_store(db)
+
+# (anime_code, page, parts version) -> (page, text, InlineKeyboardMarkup)
+page_render_cache = LRUCache(PAGE_RENDER_CACHE_SIZE, ANIME_CACHE_TTL)
+
+class AnimeCard(NamedTuple):
+    code: int
+    anime_id: int
+    photo_id: Optional[str]
+    caption: str
+    parse_mode: str
+    reply_markup: InlineKeyboardMarkup
+
+# (anime_code, anime version) -> AnimeCard
+card_render_cache = LRUCache(CARD_RENDER_CACHE_SIZE, ANIME_CACHE_TTL)
+
+# Users asking for the same card or page at once share one render.
+render_flights = SingleFlight('render')
+
+code_miss_guard = CodeMissGuard()
+
+# (search key, page) -> (anime tuple, cursor of the next page or None)
+inline_result_cache = LRUCache(INLINE_RESULT_CACHE_SIZE, INLINE_RESULT_TTL)
+# Deepest inline page served; next_offset is the page number
+INLINE_MAX_PAGE = 20
+
+def matches_prefix(query_key: str, anime) -> bool:
+    # The anime_fts rule: every query word starts some word of the title
+    title_words = search_key(anime['description']).split()
+    return all(any(word.startswith(part) for word in title_words) for part in query_key.split())
 
 class AnimeBot:
     def __init__(self):
@@ -75,13 +115,15 @@ class AnimeBot:
         self.app.add_handler(CallbackQueryHandler(self.handle_page_callback, pattern="^page_"))
         self.app.add_handler(CallbackQueryHandler(self.handle_part_callback, pattern="^part_"))
         self.app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_anime_code))
+        self.app.add_handler(ChatMemberHandler(self.track_channel_member, ChatMemberHandler.CHAT_MEMBER))
+        self.app.add_handler(InlineQueryHandler(self.handle_inline_query))
         self.app.add_handler(CommandHandler("help", self.help_command))
         
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         user_id = update.effective_user.id
-        db.add_user(user_id)
+        await db.add_user(user_id)
         
-        channels = db.get_mandatory_channels()
+        channels = await db.get_mandatory_channels()
         if not channels:
             await update.message.reply_text("Hozircha majburiy obuna kanallari mavjud emas.")
             return ConversationHandler.END
@@ -101,26 +143,9 @@ class AnimeBot:
         await query.answer()
         user_id = query.from_user.id
         
-        channels = db.get_mandatory_channels()
-        not_subscribed = []
-        
-        for channel in channels:
-            channel_id = channel['channel_id']
-            try:
-                channel_id = int(channel_id)
-            except (ValueError, TypeError):
-                pass
-            
-            is_member = False
-            try:
-                member = await context.bot.get_chat_member(channel_id, user_id)
-                if member.status in ['member', 'administrator', 'creator']:
-                    is_member = True
-            except:
-                pass
-            
-            if not is_member:
-                not_subscribed.append(channel['name'])
+        channels = await db.get_mandatory_channels()
+        missing = await subscription_gate.missing_channels(context.bot, channels, user_id, use_cache=False)
+        not_subscribed = [channel['name'] for channel in missing]
         
         if not_subscribed:
             keyboard = [[InlineKeyboardButton("🔄 Qayta tekshirish", callback_data="check")]]
@@ -133,32 +158,26 @@ class AnimeBot:
         pending_code = context.user_data.get('pending_anime_code')
         if pending_code:
             context.user_data.pop('pending_anime_code', None)
-            anime = db.get_anime_by_code(int(pending_code))
-            if not anime:
+            card = await self.get_anime_card(int(pending_code))
+            if not card:
                 await query.edit_message_text(f"❌ Kod {pending_code} bo'yicha anime topilmadi!")
                 return 2
             
-            context.user_data['current_anime_code'] = anime['code']
-            context.user_data['current_anime_id'] = anime['id']
-            
-            text = f"<b>{anime['description']}</b>" if anime['description'] else "Anime izohi"
+            context.user_data['current_anime_code'] = card.code
+            context.user_data['current_anime_id'] = card.anime_id
             
-            if anime['photo_id']:
+            if card.photo_id:
                 await query.edit_message_media(
-                    media=anime['photo_id'],
-                    caption=text,
-                    parse_mode=ParseMode.HTML,
-                    reply_markup=InlineKeyboardMarkup([[
-                        InlineKeyboardButton("🎬 Animeni ko'rish", callback_data="view")
-                    ]])
+                    media=card.photo_id,
+                    caption=card.caption,
+                    parse_mode=card.parse_mode,
+                    reply_markup=card.reply_markup
                 )
             else:
                 await query.edit_message_text(
-                    text,
-                    parse_mode=ParseMode.HTML,
-                    reply_markup=InlineKeyboardMarkup([[
-                        InlineKeyboardButton("🎬 Animeni ko'rish", callback_data="view")
-                    ]])
+                    card.caption,
+                    parse_mode=card.parse_mode,
+                    reply_markup=card.reply_markup
                 )
             
             return 3
@@ -170,6 +189,76 @@ class AnimeBot:
         )
         return 2
     
+    async def get_anime_card(self, code: int) -> Optional[AnimeCard]:
+        cache_key = (code, db.get_anime_version(code))
+        card = card_render_cache.get(cache_key)
+        if card is not None:
+            return card
+        
+        return await render_flights.run(('card', cache_key), lambda: self.render_anime_card(code, cache_key))
+    
+    async def render_anime_card(self, code: int, cache_key) -> Optional[AnimeCard]:
+        anime = await db.get_anime_by_code(code)
+        if not anime:
+            return None
+        
+        card = AnimeCard(
+            code=anime['code'],
+            anime_id=anime['id'],
+            photo_id=anime['photo_id'],
+            caption=f"<b>{anime['description']}</b>" if anime['description'] else "Anime izohi",
+            parse_mode=ParseMode.HTML,
+            reply_markup=InlineKeyboardMarkup([[
+                InlineKeyboardButton("🎬 Animeni ko'rish", callback_data="view")
+            ]])
+        )
+        card_render_cache.put(cache_key, card)
+        return card
+    
+    async def warm_up(self, top_n: int, days: int, deadline: float) -> int:
+        """Fills the caches until ``time.monotonic()`` passes ``deadline``.
+        
+        Loads the mandatory channels and the code set, then the card and the
+        first page of the part picker for the ``top_n`` anime viewed most in
+        the last ``days``, and the search index last. The deadline is checked
+        before every stage. Returns how many anime were done.
+        """
+        await db.get_mandatory_channels()
+        if time.monotonic() >= deadline:
+            return 0
+        await db.get_known_anime_codes()
+        if time.monotonic() >= deadline:
+            return 0
+        codes = await db.get_recently_viewed_codes(top_n, days)
+        
+        warmed = 0
+        for code in codes:
+            if time.monotonic() >= deadline:
+                return warmed
+            if await self.get_anime_card(code):
+                await self.get_parts_page(code, 1)
+            warmed += 1
+        
+        # The trigram build reads the whole catalog; skipped, it happens on the first fuzzy search
+        if time.monotonic() < deadline:
+            await db.get_search_index()
+        return warmed
+    
+    async def check_code_known(self, update: Update, user_id: int, code: str) -> bool:
+        # Unknown codes and users scanning the code space are answered from
+        # memory, before the subscription check and any database query.
+        if code_miss_guard.is_throttled(user_id):
+            if code_miss_guard.take_notice(user_id):
+                await update.message.reply_text("⏳ Juda ko'p noto'g'ri kod yuborildi. Birozdan keyin qayta urinib ko'ring.")
+            return False
+        
+        if not await db.anime_code_exists(int(code)):
+            code_miss_guard.record_miss(user_id)
+            await update.message.reply_text(f"❌ Kod {code} bo'yicha anime topilmadi!")
+            return False
+        
+        return True
+    
     async def search_anime(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         user_id = update.effective_user.id
         code = update.message.text.strip()
@@ -178,26 +267,11 @@ class AnimeBot:
             await update.message.reply_text("❌ Kod faqat raqam bo'lishi kerak!")
             return 2
         
-        channels = db.get_mandatory_channels()
-        not_subscribed = []
+        if not await self.check_code_known(update, user_id, code):
+            return 2
         
-        for channel in channels:
-            channel_id = channel['channel_id']
-            try:
-                channel_id = int(channel_id)
-            except (ValueError, TypeError):
-                pass
-            
-            is_member = False
-            try:
-                member = await context.bot.get_chat_member(channel_id, user_id)
-                if member.status in ['member', 'administrator', 'creator']:
-                    is_member = True
-            except:
-                pass
-            
-            if not is_member:
-                not_subscribed.append(channel)
+        channels = await db.get_mandatory_channels()
+        not_subscribed = await subscription_gate.missing_channels(context.bot, channels, user_id)
         
         if not_subscribed:
             keyboard = [[InlineKeyboardButton(ch['name'], url=ch['link'])] for ch in not_subscribed]
@@ -211,32 +285,27 @@ class AnimeBot:
             context.user_data['pending_anime_code'] = code
             return 2
         
-        anime = db.get_anime_by_code(int(code))
-        if not anime:
+        card = await self.get_anime_card(int(code))
+        if not card:
+            code_miss_guard.record_miss(user_id)
             await update.message.reply_text(f"❌ Kod {code} bo'yicha anime topilmadi!")
             return 2
         
-        context.user_data['current_anime_code'] = anime['code']
-        context.user_data['current_anime_id'] = anime['id']
-        
-        text = f"<b>{anime['description']}</b>" if anime['description'] else "Anime izohi"
+        context.user_data['current_anime_code'] = card.code
+        context.user_data['current_anime_id'] = card.anime_id
         
-        if anime['photo_id']:
+        if card.photo_id:
             await update.message.reply_photo(
-                photo=anime['photo_id'],
-                caption=text,
-                parse_mode=ParseMode.HTML,
-                reply_markup=InlineKeyboardMarkup([[
-                    InlineKeyboardButton("🎬 Animeni ko'rish", callback_data="view")
-                ]])
+                photo=card.photo_id,
+                caption=card.caption,
+                parse_mode=card.parse_mode,
+                reply_markup=card.reply_markup
             )
         else:
             await update.message.reply_text(
-                text,
-                parse_mode=ParseMode.HTML,
-                reply_markup=InlineKeyboardMarkup([[
-                    InlineKeyboardButton("🎬 Animeni ko'rish", callback_data="view")
-                ]])
+                card.caption,
+                parse_mode=card.parse_mode,
+                reply_markup=card.reply_markup
             )
         
         return 3
@@ -254,14 +323,38 @@ class AnimeBot:
         return await self.show_parts_page(query, context, anime_code, 1)
     
     async def show_parts_page(self, query, context, anime_code, page):
-        parts = db.get_anime_parts(anime_code)
-        total_parts = len(parts)
-        
-        if total_parts == 0:
+        rendered = await self.get_parts_page(anime_code, page)
+        if rendered is None:
             await query.edit_message_text("❌ Bu animeda qism yo'q!")
             return 3
         
-        parts_per_page = 10
+        page, text, reply_markup = rendered
+        context.user_data['current_page'] = page
+        
+        await query.edit_message_text(
+            text,
+            reply_markup=reply_markup
+        )
+        return 4
+    
+    async def get_parts_page(self, anime_code, page):
+        cache_key = (anime_code, page, db.get_parts_version(anime_code))
+        rendered = page_render_cache.get(cache_key)
+        
+        if rendered is None:
+            rendered = await render_flights.run(('page', cache_key), lambda: self.render_parts_page(anime_code, page))
+            if rendered is not None:
+                page_render_cache.put(cache_key, rendered)
+        
+        return rendered
+    
+    async def render_parts_page(self, anime_code, page):
+        total_parts = await db.get_anime_part_count(anime_code)
+        
+        if total_parts == 0:
+            return None
+        
+        parts_per_page = PARTS_PER_PAGE
         total_pages = (total_parts + parts_per_page - 1) // parts_per_page
         
         if page > total_pages:
@@ -269,11 +362,9 @@ class AnimeBot:
         if page < 1:
             page = 1
         
-        context.user_data['current_page'] = page
-        
         start_idx = (page - 1) * parts_per_page
         end_idx = min(start_idx + parts_per_page, total_parts)
-        page_parts = parts[start_idx:end_idx]
+        page_parts = await db.get_anime_parts_page(anime_code, start_idx, parts_per_page)
         
         keyboard = []
         for part in page_parts:
@@ -293,11 +384,7 @@ class AnimeBot:
         text = f"📺 Qismlar ({start_idx+1}-{end_idx}/{total_parts}):\n\n" \
                f"Sahifa {page}/{total_pages}"
         
-        await query.edit_message_text(
-            text,
-            reply_markup=InlineKeyboardMarkup(keyboard)
-        )
-        return 4
+        return page, text, InlineKeyboardMarkup(keyboard)
     
     async def send_part(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         query = update.callback_query
@@ -308,7 +395,7 @@ class AnimeBot:
         
         if callback_data.startswith("part_"):
             part_num = int(callback_data.split("_")[1])
-            part = db.get_anime_part(anime_code, part_num)
+            part = await db.get_anime_part(anime_code, part_num)
             
             if part:
                 await query.message.reply_video(part['file_id'])
@@ -454,7 +541,7 @@ class AnimeBot:
         
         code = int(code)
         
-        if db.get_anime_by_code(code):
+        if await db.get_anime_by_code(code):
             await update.message.reply_text(
                 f"❌ Kod {code} allaqachon mavjud!\n"
                 "Boshqa kod kiriting:"
@@ -463,9 +550,9 @@ class AnimeBot:
         
         context.user_data['anime_code'] = code
         
-        groups = db.get_all_groups()
+        groups = await db.get_all_groups()
         if not groups:
-            db.add_anime(
+            await db.add_anime(
                 code=code,
                 description=context.user_data['anime_description'],
                 photo_id=context.user_data['anime_photo_id'],
@@ -498,7 +585,7 @@ class AnimeBot:
             parts = context.user_data['anime_parts']
             groups = context.user_data.get('selected_groups', [])
             
-            db.add_anime(
+            await db.add_anime(
                 code=code,
                 description=description,
                 photo_id=photo_id,
@@ -532,13 +619,13 @@ class AnimeBot:
             return 16
         
         code = int(code)
-        anime = db.get_anime_by_code(code)
+        anime = await db.get_anime_by_code(code)
         
         if not anime:
             await update.message.reply_text(f"❌ Kod {code} topilmadi!")
             return 16
         
-        db.delete_anime(code)
+        await db.delete_anime(code)
         await update.message.reply_text(
             f"✅ Anime muvaffaqiyatli o'chirildi!\n"
             f"Kod: {code}"
@@ -553,7 +640,7 @@ class AnimeBot:
             return 17
         
         code = int(code)
-        anime = db.get_anime_by_code(code)
+        anime = await db.get_anime_by_code(code)
         
         if not anime:
             await update.message.reply_text(f"❌ Kod {code} topilmadi!")
@@ -586,24 +673,24 @@ class AnimeBot:
             return 19
         
         elif query.data == "edit_delete_part":
-            parts = db.get_anime_parts(code)
-            if not parts:
+            total_parts = await db.get_anime_part_count(code)
+            if not total_parts:
                 await query.answer("❌ Qismlar yo'q!", show_alert=True)
                 return 18
             
             await query.edit_message_text(
                 f"🔍 O'chirish uchun qism raqamini yuboring:\n"
-                f"(1-{len(parts)})"
+                f"(1-{total_parts})"
             )
             return 20
         
         elif query.data == "edit_delete_anime":
-            db.delete_anime(code)
+            await db.delete_anime(code)
             await query.edit_message_text("✅ Anime muvaffaqiyatli o'chirildi!")
             return ConversationHandler.END
         
         elif query.data == "edit_description":
-            anime = db.get_anime_by_code(code)
+            anime = await db.get_anime_by_code(code)
             await query.edit_message_text(
                 f"📝 Eski izoh:\n{anime['description']}\n\n"
                 "Yangi izohni yuboring:"
@@ -614,8 +701,7 @@ class AnimeBot:
     
     async def add_new_part(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         code = context.user_data['edit_anime_code']
-        parts = db.get_anime_parts(code)
-        next_part_num = len(parts) + 1
+        next_part_num = await db.get_anime_part_count(code) + 1
         
         if update.message.video:
             file_id = update.message.video.file_id
@@ -625,7 +711,7 @@ class AnimeBot:
             await update.message.reply_text("❌ Video turini qabul qilaman!")
             return 19
         
-        db.add_anime_part(code, next_part_num, file_id)
+        await db.add_anime_part(code, next_part_num, file_id)
         
         keyboard = [
             [InlineKeyboardButton("✅ Ha", callback_data="edit_desc_yes")],
@@ -648,12 +734,12 @@ class AnimeBot:
             await update.message.reply_text("❌ Faqat raqam yuboring!")
             return 20
         
-        parts = db.get_anime_parts(code)
-        if part_num < 1 or part_num > len(parts):
-            await update.message.reply_text(f"❌ Qism 1-{len(parts)} orasida bo'lishi kerak!")
+        total_parts = await db.get_anime_part_count(code)
+        if part_num < 1 or part_num > total_parts:
+            await update.message.reply_text(f"❌ Qism 1-{total_parts} orasida bo'lishi kerak!")
             return 20
         
-        db.delete_anime_part(code, part_num)
+        await db.delete_anime_part(code, part_num)
         
         await update.message.reply_text(
             f"✅ {part_num}-qism o'chirildi!"
@@ -692,7 +778,7 @@ class AnimeBot:
         group_id = context.user_data['group_id']
         link = context.user_data['group_link']
         
-        db.add_group(group_id, link, name)
+        await db.add_group(group_id, link, name)
         
         await update.message.reply_text(
             f"✅ Guruh qo'shildi!\n"
@@ -702,7 +788,7 @@ class AnimeBot:
         return ConversationHandler.END
     
     async def show_groups_list(self, query) -> int:
-        groups = db.get_all_groups()
+        groups = await db.get_all_groups()
         
         if not groups:
             await query.edit_message_text("📋 Hozircha guruh yo'q!")
@@ -718,7 +804,7 @@ class AnimeBot:
         return 10
     
     async def show_delete_group(self, query) -> int:
-        groups = db.get_all_groups()
+        groups = await db.get_all_groups()
         
         if not groups:
             await query.answer("❌ Guruh yo'q!", show_alert=True)
@@ -742,7 +828,7 @@ class AnimeBot:
             return ConversationHandler.END
         
         group_id = int(query.data.split("_")[2])
-        db.delete_group(group_id)
+        await db.delete_group(group_id)
         
         await query.answer("✅ Guruh o'chirildi!")
         return 24
@@ -751,7 +837,7 @@ class AnimeBot:
         code = context.user_data['edit_anime_code']
         new_description = update.message.text.strip()
         
-        db.update_anime_description(code, new_description)
+        await db.update_anime_description(code, new_description)
         
         await update.message.reply_text(
             "✅ Izoh o'zgartirildi!"
@@ -795,7 +881,7 @@ class AnimeBot:
         channel_id = context.user_data['mandatory_channel_id']
         link = context.user_data['mandatory_channel_link']
         
-        db.add_mandatory_channel(channel_id, link, name)
+        await db.add_mandatory_channel(channel_id, link, name)
         
         await update.message.reply_text(
             f"✅ Obuna kanali qo'shildi!\n"
@@ -807,7 +893,7 @@ class AnimeBot:
         return ConversationHandler.END
     
     async def show_delete_mandatory_channel(self, query) -> int:
-        channels = db.get_mandatory_channels()
+        channels = await db.get_mandatory_channels()
         
         if not channels:
             await query.edit_message_text("📌 Majburiy obuna kanallari yo'q!")
@@ -831,7 +917,7 @@ class AnimeBot:
             return ConversationHandler.END
         
         channel_id = int(query.data.split("_")[3])
-        db.delete_mandatory_channel(channel_id)
+        await db.delete_mandatory_channel(channel_id)
         
         await query.answer("✅ Kanal o'chirildi!")
         return 29
@@ -865,28 +951,13 @@ Admin panelida:
         if not code.isdigit():
             return
         
-        db.add_user(user_id)
+        if not await self.check_code_known(update, user_id, code):
+            return
         
-        channels = db.get_mandatory_channels()
-        not_subscribed = []
+        await db.add_user(user_id)
         
-        for channel in channels:
-            channel_id = channel['channel_id']
-            try:
-                channel_id = int(channel_id)
-            except (ValueError, TypeError):
-                pass
-            
-            is_member = False
-            try:
-                member = await context.bot.get_chat_member(channel_id, user_id)
-                if member.status in ['member', 'administrator', 'creator']:
-                    is_member = True
-            except:
-                pass
-            
-            if not is_member:
-                not_subscribed.append(channel)
+        channels = await db.get_mandatory_channels()
+        not_subscribed = await subscription_gate.missing_channels(context.bot, channels, user_id)
         
         if not_subscribed:
             keyboard = [[InlineKeyboardButton(ch['name'], url=ch['link'])] for ch in not_subscribed]
@@ -900,32 +971,27 @@ Admin panelida:
             context.user_data['pending_anime_code'] = code
             return
         
-        anime = db.get_anime_by_code(int(code))
-        if not anime:
+        card = await self.get_anime_card(int(code))
+        if not card:
+            code_miss_guard.record_miss(user_id)
             await update.message.reply_text(f"❌ Kod {code} bo'yicha anime topilmadi!")
             return
         
-        context.user_data['current_anime_code'] = anime['code']
-        context.user_data['current_anime_id'] = anime['id']
-        
-        text = f"<b>{anime['description']}</b>" if anime['description'] else "Anime izohi"
+        context.user_data['current_anime_code'] = card.code
+        context.user_data['current_anime_id'] = card.anime_id
         
-        if anime['photo_id']:
+        if card.photo_id:
             await update.message.reply_photo(
-                photo=anime['photo_id'],
-                caption=text,
-                parse_mode=ParseMode.HTML,
-                reply_markup=InlineKeyboardMarkup([[
-                    InlineKeyboardButton("🎬 Animeni ko'rish", callback_data="view")
-                ]])
+                photo=card.photo_id,
+                caption=card.caption,
+                parse_mode=card.parse_mode,
+                reply_markup=card.reply_markup
             )
         else:
             await update.message.reply_text(
-                text,
-                parse_mode=ParseMode.HTML,
-                reply_markup=InlineKeyboardMarkup([[
-                    InlineKeyboardButton("🎬 Animeni ko'rish", callback_data="view")
-                ]])
+                card.caption,
+                parse_mode=card.parse_mode,
+                reply_markup=card.reply_markup
             )
     
     async def handle_verify_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -933,26 +999,9 @@ Admin panelida:
         await query.answer()
         user_id = query.from_user.id
         
-        channels = db.get_mandatory_channels()
-        not_subscribed = []
-        
-        for channel in channels:
-            channel_id = channel['channel_id']
-            try:
-                channel_id = int(channel_id)
-            except (ValueError, TypeError):
-                pass
-            
-            is_member = False
-            try:
-                member = await context.bot.get_chat_member(channel_id, user_id)
-                if member.status in ['member', 'administrator', 'creator']:
-                    is_member = True
-            except:
-                pass
-            
-            if not is_member:
-                not_subscribed.append(channel['name'])
+        channels = await db.get_mandatory_channels()
+        missing = await subscription_gate.missing_channels(context.bot, channels, user_id, use_cache=False)
+        not_subscribed = [channel['name'] for channel in missing]
         
         if not_subscribed:
             keyboard = [[InlineKeyboardButton("🔄 Qayta tekshirish", callback_data="check_verify")]]
@@ -965,32 +1014,26 @@ Admin panelida:
         pending_code = context.user_data.get('pending_anime_code')
         if pending_code:
             context.user_data.pop('pending_anime_code', None)
-            anime = db.get_anime_by_code(int(pending_code))
-            if not anime:
+            card = await self.get_anime_card(int(pending_code))
+            if not card:
                 await query.edit_message_text(f"❌ Kod {pending_code} bo'yicha anime topilmadi!")
                 return
             
-            context.user_data['current_anime_code'] = anime['code']
-            context.user_data['current_anime_id'] = anime['id']
-            
-            text = f"<b>{anime['description']}</b>" if anime['description'] else "Anime izohi"
+            context.user_data['current_anime_code'] = card.code
+            context.user_data['current_anime_id'] = card.anime_id
             
-            if anime['photo_id']:
+            if card.photo_id:
                 await query.edit_message_media(
-                    media=anime['photo_id'],
-                    caption=text,
-                    parse_mode=ParseMode.HTML,
-                    reply_markup=InlineKeyboardMarkup([[
-                        InlineKeyboardButton("🎬 Animeni ko'rish", callback_data="view")
-                    ]])
+                    media=card.photo_id,
+                    caption=card.caption,
+                    parse_mode=card.parse_mode,
+                    reply_markup=card.reply_markup
                 )
             else:
                 await query.edit_message_text(
-                    text,
-                    parse_mode=ParseMode.HTML,
-                    reply_markup=InlineKeyboardMarkup([[
-                        InlineKeyboardButton("🎬 Animeni ko'rish", callback_data="view")
-                    ]])
+                    card.caption,
+                    parse_mode=card.parse_mode,
+                    reply_markup=card.reply_markup
                 )
         else:
             await query.edit_message_text(
@@ -1037,15 +1080,102 @@ Admin panelida:
         
         if callback_data.startswith("part_"):
             part_num = int(callback_data.split("_")[1])
-            part = db.get_anime_part(anime_code, part_num)
+            part = await db.get_anime_part(anime_code, part_num)
             
             if part:
                 await query.message.reply_video(part['file_id'])
             else:
                 await query.answer("❌ Qism topilmadi!", show_alert=True)
     
+    async def track_channel_member(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        # Telegram sends chat_member updates for channels where the bot is admin;
+        # they keep channel_members current so the gate rarely needs the API.
+        change = update.chat_member
+        user_id = change.new_chat_member.user.id
+        subscribed = change.new_chat_member.status in MEMBER_STATUSES
+        
+        for channel in await db.get_mandatory_channels():
+            if matches_chat(channel['channel_id'], change.chat):
+                await subscription_gate.record(user_id, channel['channel_id'], subscribed)
+    
+    async def handle_inline_query(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        inline_query = update.inline_query
+        key = search_key(inline_query.query)
+        page = int(inline_query.offset) if inline_query.offset.isdigit() else 0
+        
+        results, cursor = ((), None)
+        if key and page <= INLINE_MAX_PAGE:
+            results, cursor = await self.inline_search_page(key, page)
+        
+        await inline_query.answer(
+            [self.inline_result(anime) for anime in results],
+            cache_time=INLINE_CACHE_TIME,
+            is_personal=False,
+            next_offset=str(page + 1) if cursor and page < INLINE_MAX_PAGE else ''
+        )
+    
+    async def inline_search_page(self, key: str, page: int):
+        cached = inline_result_cache.get((key, page))
+        if cached is not None:
+            return cached
+        
+        if page == 0:
+            entry = self.narrow_cached_prefix(key)
+            if entry is None:
+                results, cursor = await db.search_anime_page(key, limit=INLINE_PAGE_SIZE)
+                entry = (tuple(results), cursor)
+        else:
+            previous_results, previous_cursor = await self.inline_search_page(key, page - 1)
+            if previous_cursor is None:
+                return (), None
+            results, cursor = await db.search_anime_page(cursor=previous_cursor, limit=INLINE_PAGE_SIZE)
+            entry = (tuple(results), cursor)
+        
+        inline_result_cache.put((key, page), entry)
+        return entry
+    
+    def narrow_cached_prefix(self, key: str):
+        # Typing only narrows a prefix match, so while a user types, the
+        # complete first page of a shorter query already holds every answer.
+        for length in range(len(key) - 1, 0, -1):
+            prefix = key[:length].strip()
+            cached = inline_result_cache.get((prefix, 0))
+            if cached is None:
+                continue
+            results, cursor = cached
+            # Only exact prefix results can be narrowed, not typo-tolerant ones
+            if cursor is not None or not all(matches_prefix(prefix, anime) for anime in results):
+                return None
+            narrowed = tuple(anime for anime in results if matches_prefix(key, anime))
+            return (narrowed, None) if narrowed else None
+        return None
+    
+    def inline_result(self, anime):
+        # Inline results reach any chat, so the description is never taken as markup
+        caption = f"<b>{html.escape(anime['description'])}</b>" if anime['description'] else "Anime izohi"
+        caption += f"\n\n🔢 Kod: <code>{anime['code']}</code>"
+        
+        if anime['photo_id']:
+            return InlineQueryResultCachedPhoto(
+                id=str(anime['code']),
+                photo_file_id=anime['photo_id'],
+                title=anime['description'] or f"Kod: {anime['code']}",
+                caption=caption,
+                parse_mode=ParseMode.HTML
+            )
+        
+        return InlineQueryResultArticle(
+            id=str(anime['code']),
+            title=anime['description'] or f"Kod: {anime['code']}",
+            description=f"Kod: {anime['code']}",
+            input_message_content=InputTextMessageContent(caption, parse_mode=ParseMode.HTML)
+        )
+    
     def run(self):
-        self.app.run_polling()
+        try:
+            self.app.run_polling(allowed_updates=Update.ALL_TYPES)
+        finally:
+            db.close()
 
 if __name__ == '__main__':
     bot = AnimeBot()
@@ -0,0 +1,186 @@
+import asyncio
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+_MISSING = object()
+
+class LRUCache:
+    """Thread-safe, size-bounded LRU cache with a per-entry TTL.
+
+    ``get_or_load`` reads through to ``loader`` on a miss. A value loaded
+    while an ``invalidate`` of the same key was in flight is returned but
+    not stored, so a slow reader can never put back data that a writer has
+    just replaced.
+    """
+
+    def __init__(self, max_items: int = 1000, ttl: float = 300):
+        self.max_items = max_items
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._versions = {}
+        self._epoch = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_items > 0
+
+    def get(self, key: Hashable, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def _version(self, key: Hashable) -> tuple:
+        return self._epoch, self._versions.get(key, 0)
+
+    def version(self, key: Hashable) -> tuple:
+        """Changes every time ``key`` is invalidated; usable as part of a derived cache key."""
+        with self._lock:
+            return self._version(key)
+
+    def put(self, key: Hashable, value: Any, version: tuple = None, ttl: float = None):
+        if not self.enabled:
+            return
+        with self._lock:
+            if version is not None and self._version(key) != version:
+                return
+            self._data[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_items:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]):
+        if not self.enabled:
+            return loader()
+
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        with self._lock:
+            version = self._version(key)
+        value = loader()
+        if value is not None:
+            self.put(key, value, version)
+        return value
+
+    def invalidate(self, *keys: Hashable):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+                self._versions[key] = self._versions.get(key, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._epoch += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / total if total else 0.0,
+            }
+
+class VersionedSnapshot:
+    """A single cached value tagged with a version counter kept in the database.
+
+    The counter is re-read at most every ``check_interval`` seconds and the
+    value reloaded only when it changed, so other processes writing to the
+    same database are picked up within that interval. ``invalidate`` makes
+    the next ``get`` check the counter straight away.
+    """
+
+    def __init__(self, check_interval: float = 5):
+        self.check_interval = check_interval
+        self._value = _MISSING
+        self._version = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.reloads = 0
+
+    def get(self, read_version: Callable[[], Any], loader: Callable[[], Any]):
+        with self._lock:
+            if self._value is not _MISSING and time.monotonic() - self._checked_at < self.check_interval:
+                return self._value
+
+            version = read_version()
+            if self._value is _MISSING or version != self._version:
+                self._value = loader()
+                self._version = version
+                self.reloads += 1
+            self._checked_at = time.monotonic()
+            return self._value
+
+    def invalidate(self):
+        with self._lock:
+            self._checked_at = 0.0
+
+class SingleFlight:
+    """Collapses concurrent awaits of the same key into one computation.
+
+    The first caller for a key starts ``factory()`` as a task; everyone who
+    asks for that key while it is running awaits the same task and gets its
+    result or exception. Nothing is kept once the task finishes, so this
+    only removes stampedes and never serves stale data. A caller that is
+    cancelled does not cancel the shared task.
+
+    Live instances are registered under ``name``; ``get_coalescing_stats``
+    sums the counters of all instances sharing a name.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight = {}
+        self.calls = 0
+        self.coalesced = 0
+        _single_flights.setdefault(name, weakref.WeakSet()).add(self)
+
+    def _done(self, key: Hashable, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable]):
+        self.calls += 1
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done, key=key: self._done(key, done))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict:
+        return {'calls': self.calls, 'coalesced': self.coalesced, 'in_flight': len(self._inflight)}
+
+_single_flights: Dict[str, 'weakref.WeakSet[SingleFlight]'] = {}
+
+def get_coalescing_stats() -> Dict[str, Dict]:
+    totals = {}
+    for name, flights in _single_flights.items():
+        for flight in list(flights):
+            total = totals.setdefault(name, {'calls': 0, 'coalesced': 0, 'in_flight': 0})
+            for field, value in flight.stats().items():
+                total[field] += value
+    return totals
@@ -19,6 +19,107 @@ MANDATORY_CHANNELS = [
 
 DATABASE_PATH = 'anime_bot.db'
 
+DATABASE_POOL_SIZE = int(os.getenv('DATABASE_POOL_SIZE', '5'))
+
+DATABASE_POOL_TIMEOUT = float(os.getenv('DATABASE_POOL_TIMEOUT', '30'))
+
+DATABASE_HEALTH_CHECK_INTERVAL = float(os.getenv('DATABASE_HEALTH_CHECK_INTERVAL', '60'))
+
+WRITE_BEHIND_ENABLED = os.getenv('WRITE_BEHIND_ENABLED', '1') == '1'
+
+WRITE_BEHIND_MAX_ITEMS = int(os.getenv('WRITE_BEHIND_MAX_ITEMS', '500'))
+
+WRITE_BEHIND_FLUSH_INTERVAL = float(os.getenv('WRITE_BEHIND_FLUSH_INTERVAL', '2'))
+
+WRITE_BEHIND_MAX_PENDING = int(os.getenv('WRITE_BEHIND_MAX_PENDING', '100000'))
+
+ANALYTICS_SNAPSHOT_ENABLED = os.getenv('ANALYTICS_SNAPSHOT_ENABLED', '1') == '1'
+
+ANALYTICS_SNAPSHOT_PATH = os.getenv('ANALYTICS_SNAPSHOT_PATH', '')
+
+ANALYTICS_SNAPSHOT_MAX_AGE = float(os.getenv('ANALYTICS_SNAPSHOT_MAX_AGE', '300'))
+
+MIGRATION_BATCH_SIZE = int(os.getenv('MIGRATION_BATCH_SIZE', '5000'))
+
+MIGRATION_BATCH_PAUSE = float(os.getenv('MIGRATION_BATCH_PAUSE', '0.01'))
+
+ANIME_CACHE_SIZE = int(os.getenv('ANIME_CACHE_SIZE', '1000'))
+
+ANIME_CACHE_TTL = float(os.getenv('ANIME_CACHE_TTL', '300'))
+
+PAGE_RENDER_CACHE_SIZE = int(os.getenv('PAGE_RENDER_CACHE_SIZE', '2000'))
+
+CARD_RENDER_CACHE_SIZE = int(os.getenv('CARD_RENDER_CACHE_SIZE', '1000'))
+
+CHANNEL_CACHE_CHECK_INTERVAL = float(os.getenv('CHANNEL_CACHE_CHECK_INTERVAL', '5'))
+
+MEMBERSHIP_CACHE_SIZE = int(os.getenv('MEMBERSHIP_CACHE_SIZE', '50000'))
+
+MEMBERSHIP_MEMBER_TTL = float(os.getenv('MEMBERSHIP_MEMBER_TTL', '600'))
+
+MEMBERSHIP_NOT_MEMBER_TTL = float(os.getenv('MEMBERSHIP_NOT_MEMBER_TTL', '30'))
+
+MEMBERSHIP_STORE_TTL = float(os.getenv('MEMBERSHIP_STORE_TTL', '86400'))
+
+SUBSCRIPTION_CHECK_TIMEOUT = float(os.getenv('SUBSCRIPTION_CHECK_TIMEOUT', '3'))
+
+SUBSCRIPTION_FAIL_OPEN = os.getenv('SUBSCRIPTION_FAIL_OPEN', '0') == '1'
+
+ANIME_CODES_CHECK_INTERVAL = float(os.getenv('ANIME_CODES_CHECK_INTERVAL', '5'))
+
+CODE_MISS_LIMIT = int(os.getenv('CODE_MISS_LIMIT', '10'))
+
+CODE_MISS_WINDOW = float(os.getenv('CODE_MISS_WINDOW', '60'))
+
+CODE_MISS_TRACKED_USERS = int(os.getenv('CODE_MISS_TRACKED_USERS', '10000'))
+
+WARMUP_ENABLED = os.getenv('WARMUP_ENABLED', '1') == '1'
+
+WARMUP_TOP_N = int(os.getenv('WARMUP_TOP_N', '50'))
+
+WARMUP_TIME_BUDGET = float(os.getenv('WARMUP_TIME_BUDGET', '10'))
+
+WARMUP_HISTORY_DAYS = int(os.getenv('WARMUP_HISTORY_DAYS', '3'))
+
+SEARCH_PAGE_SIZE = int(os.getenv('SEARCH_PAGE_SIZE', '5'))
+
+INLINE_PAGE_SIZE = int(os.getenv('INLINE_PAGE_SIZE', '20'))
+
+INLINE_CACHE_TIME = int(os.getenv('INLINE_CACHE_TIME', '60'))
+
+INLINE_RESULT_CACHE_SIZE = int(os.getenv('INLINE_RESULT_CACHE_SIZE', '5000'))
+
+INLINE_RESULT_TTL = float(os.getenv('INLINE_RESULT_TTL', '30'))
+
+DATABASE_PROFILE = os.getenv('DATABASE_PROFILE', 'balanced')
+
+DATABASE_PROFILES = {
+    'safe': {
+        'journal_mode': 'WAL',
+        'synchronous': 'FULL',
+        'cache_size': -8000,
+        'mmap_size': 0,
+        'temp_store': 'DEFAULT',
+        'busy_timeout': 5000,
+    },
+    'balanced': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -32000,
+        'mmap_size': 134217728,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000,
+    },
+    'fast': {
+        'journal_mode': 'WAL',
+        'synchronous': 'OFF',
+        'cache_size': -128000,
+        'mmap_size': 536870912,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 10000,
+    },
+}
+
 MAX_MESSAGE_LENGTH = 4096
 
 PARTS_PER_PAGE = 10
@@ -1,454 +1,1418 @@
 import sqlite3
+import asyncio
+import atexit
+import base64
+import functools
 import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Tuple
+from cache import LRUCache, SingleFlight, VersionedSnapshot
+from search_index import TrigramIndex, search_key
+from migrations import MigrationRunner
+from models import Anime, AnimePart, User, Group, Channel, PART_POSITION_GAP
+from config import (
+    DATABASE_POOL_SIZE, DATABASE_POOL_TIMEOUT, DATABASE_HEALTH_CHECK_INTERVAL,
+    DATABASE_PROFILE, DATABASE_PROFILES,
+    WRITE_BEHIND_ENABLED, WRITE_BEHIND_MAX_ITEMS, WRITE_BEHIND_FLUSH_INTERVAL, WRITE_BEHIND_MAX_PENDING,
+    ANALYTICS_SNAPSHOT_ENABLED, ANALYTICS_SNAPSHOT_PATH, ANALYTICS_SNAPSHOT_MAX_AGE,
+    ANIME_CACHE_SIZE, ANIME_CACHE_TTL, CHANNEL_CACHE_CHECK_INTERVAL, ANIME_CODES_CHECK_INTERVAL,
+    SEARCH_PAGE_SIZE
+)
 
-class Database:
-    def __init__(self, db_path='anime_bot.db'):
+class ConnectionPool:
+    """Thread-aware pool of reusable SQLite connections.
+
+    A connection is checked out by one thread at a time; nested
+    ``connection()`` calls from the same thread reuse the held connection.
+    Idle connections are pinged before reuse once they have been idle
+    longer than ``health_check_interval`` seconds. ``pragmas`` are applied
+    to every new connection, in order. ``read_only`` pools open the file
+    with ``mode=ro`` and cannot take write locks.
+    """
+
+    def __init__(self, db_path: str, size: int = DATABASE_POOL_SIZE,
+                 timeout: float = DATABASE_POOL_TIMEOUT,
+                 health_check_interval: float = DATABASE_HEALTH_CHECK_INTERVAL,
+                 pragmas: Dict = None, read_only: bool = False):
         self.db_path = db_path
-        self.init_database()
-    
-    def init_database(self):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                user_id INTEGER PRIMARY KEY,
-                username TEXT,
-                first_name TEXT,
-                last_name TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS anime (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                code INTEGER UNIQUE NOT NULL,
-                description TEXT,
-                photo_id TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS anime_parts (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                anime_code INTEGER NOT NULL,
-                part_number INTEGER NOT NULL,
-                file_id TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (anime_code) REFERENCES anime(code),
-                UNIQUE(anime_code, part_number)
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS groups (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                group_id INTEGER UNIQUE NOT NULL,
-                link TEXT,
-                name TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS anime_groups (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                anime_code INTEGER NOT NULL,
-                group_id INTEGER NOT NULL,
-                added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (anime_code) REFERENCES anime(code),
-                FOREIGN KEY (group_id) REFERENCES groups(id),
-                UNIQUE(anime_code, group_id)
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS mandatory_channels (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                channel_id TEXT UNIQUE NOT NULL,
-                link TEXT,
-                name TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS user_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                anime_code INTEGER,
-                part_number INTEGER,
-                viewed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(user_id)
-            )
-        ''')
-        
-        conn.commit()
-        conn.close()
-    
-    def add_user(self, user_id, username=None, first_name=None, last_name=None):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
+        self.read_only = read_only
+        self.size = max(1, size)
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.pragmas = dict(pragmas or {})
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._local = threading.local()
+        self._closed = False
+
+    def _create_connection(self) -> sqlite3.Connection:
+        if self.read_only:
+            conn = sqlite3.connect(f'file:{self.db_path}?mode=ro', uri=True,
+                                   timeout=self.timeout, check_same_thread=False)
+        else:
+            conn = sqlite3.connect(self.db_path, timeout=self.timeout, check_same_thread=False)
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        # For migrations only: triggers and schema must not depend on it,
+        # since other tools open the file without this function.
+        conn.create_function('search_key', 1, search_key, deterministic=True)
+        return conn
+
+    @staticmethod
+    def _is_healthy(conn: sqlite3.Connection) -> bool:
         try:
-            cursor.execute('''
-                INSERT OR IGNORE INTO users (user_id, username, first_name, last_name)
-                VALUES (?, ?, ?, ?)
-            ''', (user_id, username, first_name, last_name))
-            
-            cursor.execute('''
-                UPDATE users SET last_seen = CURRENT_TIMESTAMP
-                WHERE user_id = ?
-            ''', (user_id,))
-            
-            conn.commit()
-        except Exception as e:
-            print(f"Error adding user: {e}")
-        finally:
-            conn.close()
-    
-    def add_anime(self, code: int, description: str = None, photo_id: str = None, 
-                  parts: List[Dict] = None, groups: List[int] = None):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
+            conn.execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    @staticmethod
+    def _discard(conn: sqlite3.Connection):
         try:
-            cursor.execute('''
-                INSERT INTO anime (code, description, photo_id)
-                VALUES (?, ?, ?)
-            ''', (code, description, photo_id))
-            
-            if parts:
-                for part in parts:
-                    cursor.execute('''
-                        INSERT INTO anime_parts (anime_code, part_number, file_id)
-                        VALUES (?, ?, ?)
-                    ''', (code, part['part_number'], part['file_id']))
-            
-            if groups:
-                for group_id in groups:
-                    cursor.execute('''
-                        INSERT OR IGNORE INTO anime_groups (anime_code, group_id)
-                        VALUES (?, ?)
-                    ''', (code, group_id))
-            
-            conn.commit()
-        except Exception as e:
-            print(f"Error adding anime: {e}")
-        finally:
             conn.close()
-    
-    def get_anime_by_code(self, code: int) -> Optional[Dict]:
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
+        except sqlite3.Error:
+            pass
+
+    def acquire(self) -> sqlite3.Connection:
+        if self._closed:
+            raise sqlite3.ProgrammingError("Connection pool is closed")
+
+        if not self._slots.acquire(timeout=self.timeout):
+            raise sqlite3.OperationalError("Timed out waiting for a database connection")
+
         try:
-            cursor.execute('SELECT * FROM anime WHERE code = ?', (code,))
-            row = cursor.fetchone()
-            return dict(row) if row else None
-        finally:
-            conn.close()
-    
-    def get_anime_parts(self, anime_code: int) -> List[Dict]:
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
+            while True:
+                try:
+                    conn, last_used = self._idle.get_nowait()
+                except queue.Empty:
+                    return self._create_connection()
+
+                idle_for = time.monotonic() - last_used
+                if idle_for < self.health_check_interval or self._is_healthy(conn):
+                    return conn
+                self._discard(conn)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, conn: sqlite3.Connection):
         try:
-            cursor.execute('''
-                SELECT * FROM anime_parts 
-                WHERE anime_code = ? 
-                ORDER BY part_number ASC
-            ''', (anime_code,))
-            return [dict(row) for row in cursor.fetchall()]
+            if conn.in_transaction:
+                conn.rollback()
+            if self._closed:
+                self._discard(conn)
+            else:
+                self._idle.put((conn, time.monotonic()))
+        except sqlite3.Error:
+            self._discard(conn)
         finally:
-            conn.close()
-    
-    def get_anime_part(self, anime_code: int, part_number: int) -> Optional[Dict]:
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        held = getattr(self._local, 'conn', None)
+        if held is not None:
+            yield held
+            return
+
+        conn = self.acquire()
+        self._local.conn = conn
         try:
-            cursor.execute('''
-                SELECT * FROM anime_parts 
-                WHERE anime_code = ? AND part_number = ?
-            ''', (anime_code, part_number))
-            row = cursor.fetchone()
-            return dict(row) if row else None
+            yield conn
         finally:
-            conn.close()
-    
-    def add_anime_part(self, anime_code: int, part_number: int, file_id: str):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
+            self._local.conn = None
+            self.release(conn)
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+class WriteBehindBuffer:
+    """Collects user touches and view history and writes them in batches.
+
+    Events are flushed in one transaction once ``max_items`` are pending or
+    every ``flush_interval`` seconds, whichever comes first. Repeated
+    ``last_seen`` touches for the same user collapse into a single update.
+    The flusher thread starts on the first event and drains on ``stop()``
+    (also registered with ``atexit``).
+
+    A failed flush puts its events back for the next attempt, keeping at
+    most ``max_pending`` of them; the oldest beyond that are dropped.
+    """
+
+    def __init__(self, db: 'Database', max_items: int = WRITE_BEHIND_MAX_ITEMS,
+                 flush_interval: float = WRITE_BEHIND_FLUSH_INTERVAL,
+                 max_pending: int = WRITE_BEHIND_MAX_PENDING):
+        self.db = db
+        self.max_items = max(1, max_items)
+        self.flush_interval = flush_interval
+        self.max_pending = max(self.max_items, max_pending)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._users = {}
+        self._history = []
+        self._thread = None
+        self._stopped = False
+        self.flushes = 0
+        self.flushed_events = 0
+        self.dropped_events = 0
+
+    @staticmethod
+    def _now() -> str:
+        return datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+
+    def _ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            if self._thread is None:
+                atexit.register(self.stop)
+            self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+            self._thread.start()
+
+    def _enqueue(self, add):
+        with self._lock:
+            if self._stopped:
+                raise sqlite3.ProgrammingError("Write-behind buffer is stopped")
+            add()
+            self._ensure_started()
+            full = len(self._users) + len(self._history) >= self.max_items
+
+        if full:
+            self._wake.set()
+
+    def touch_user(self, user_id, username=None, first_name=None, last_name=None):
+        def add():
+            previous = self._users.get(user_id)
+            if previous:
+                self._users[user_id] = (
+                    username or previous[0],
+                    first_name or previous[1],
+                    last_name or previous[2],
+                    self._now()
+                )
+            else:
+                self._users[user_id] = (username, first_name, last_name, self._now())
+
+        self._enqueue(add)
+
+    def add_history(self, user_id: int, anime_code: int, part_number: int = None):
+        self._enqueue(lambda: self._history.append((user_id, anime_code, part_number, self._now())))
+
+    def flush(self) -> int:
+        with self._lock:
+            users, self._users = self._users, {}
+            history, self._history = self._history, []
+
+        if not users and not history:
+            return 0
+
         try:
-            cursor.execute('''
-                INSERT INTO anime_parts (anime_code, part_number, file_id)
-                VALUES (?, ?, ?)
-            ''', (anime_code, part_number, file_id))
-            
-            conn.commit()
+            # Checking out a connection can time out too; that must not lose
+            # the batch or kill the flusher thread.
+            with self.db.pool.connection() as conn:
+                try:
+                    conn.executemany('''
+                        INSERT OR IGNORE INTO users (user_id, username, first_name, last_name, created_at, last_seen)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                    ''', [(user_id, u[0], u[1], u[2], u[3], u[3]) for user_id, u in users.items()])
+
+                    conn.executemany('''
+                        UPDATE users SET last_seen = ? WHERE user_id = ?
+                    ''', [(u[3], user_id) for user_id, u in users.items()])
+
+                    conn.executemany('''
+                        INSERT INTO user_history (user_id, anime_code, part_number, viewed_at)
+                        VALUES (?, ?, ?, ?)
+                    ''', history)
+
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
         except Exception as e:
-            print(f"Error adding part: {e}")
-        finally:
-            conn.close()
-    
-    def delete_anime_part(self, anime_code: int, part_number: int):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
+            print(f"Error flushing write-behind buffer: {e}")
+            self._requeue(users, history)
+            return 0
+
+        self.flushes += 1
+        self.flushed_events += len(users) + len(history)
+        return len(users) + len(history)
+
+    def _requeue(self, users: Dict, history: List):
+        with self._lock:
+            for user_id, user in users.items():
+                if len(self._users) >= self.max_pending:
+                    self.dropped_events += 1
+                    continue
+                self._users.setdefault(user_id, user)
+
+            self._history[:0] = history
+            overflow = len(self._history) - self.max_pending
+            if overflow > 0:
+                del self._history[:overflow]
+                self.dropped_events += overflow
+                print(f"Write-behind buffer full, dropped {overflow} oldest history events")
+
+    def _run(self):
+        while not self._stopped:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error in write-behind flusher: {e}")
+
+    def stop(self):
+        with self._lock:
+            if self._stopped:
+                return
+            self._stopped = True
+
+        self._wake.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self.flush()
+
+class AnalyticsDatabase:
+    """Read-only connections for admin reports, kept apart from the user path.
+
+    With ``use_snapshot`` the reports read a copy of the database taken with
+    the backup API and refreshed once it is older than ``max_age`` seconds,
+    so long aggregates never hold locks on the live file. The snapshot's
+    mtime is its age, which lets several bot processes share one copy.
+    Without a snapshot (or if it cannot be made) ``mode=ro`` connections
+    to the live file are used and the data is never stale.
+    """
+
+    READ_PRAGMAS = ('cache_size', 'mmap_size', 'temp_store', 'busy_timeout')
+
+    def __init__(self, db_path: str = 'anime_bot.db', snapshot_path: str = None,
+                 max_age: float = ANALYTICS_SNAPSHOT_MAX_AGE,
+                 use_snapshot: bool = ANALYTICS_SNAPSHOT_ENABLED,
+                 pool_size: int = 2, profile: str = DATABASE_PROFILE):
+        root, ext = os.path.splitext(db_path)
+        self.db_path = db_path
+        self.snapshot_path = snapshot_path or ANALYTICS_SNAPSHOT_PATH or f'{root}.analytics{ext or ".db"}'
+        self.max_age = max_age
+        self.use_snapshot = use_snapshot
+        self.pool_size = pool_size
+        self.pragmas = {name: value for name, value in DATABASE_PROFILES[profile].items()
+                        if name in self.READ_PRAGMAS}
+        self.pragmas['query_only'] = 1
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pool_source = None
+        self._pool_mtime = None
+
+    def _snapshot_mtime(self) -> Optional[float]:
+        try:
+            return os.path.getmtime(self.snapshot_path)
+        except OSError:
+            return None
+
+    def refresh(self) -> bool:
+        """Re-copy the live database into the snapshot file."""
+        temp_path = f'{self.snapshot_path}.{os.getpid()}.tmp'
         try:
+            source = sqlite3.connect(f'file:{self.db_path}?mode=ro', uri=True)
+            target = sqlite3.connect(temp_path)
+            try:
+                # One step: a stepped copy restarts whenever the bot commits
+                # and may never finish on a busy database
+                source.backup(target)
+                target.execute('PRAGMA journal_mode = DELETE')
+            finally:
+                target.close()
+                source.close()
+            os.replace(temp_path, self.snapshot_path)
+            return True
+        except (sqlite3.Error, OSError) as e:
+            print(f"Error refreshing analytics snapshot: {e}")
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            return False
+
+    def _current_source(self) -> str:
+        if not self.use_snapshot:
+            return self.db_path
+
+        mtime = self._snapshot_mtime()
+        if mtime is None or time.time() - mtime > self.max_age:
+            if self.refresh():
+                return self.snapshot_path
+            if mtime is None:
+                return self.db_path
+        return self.snapshot_path
+
+    def snapshot_age(self) -> float:
+        """Seconds since the data the reports read was copied (0 for live reads)."""
+        if not self.use_snapshot or self._pool_source != self.snapshot_path:
+            return 0.0
+        mtime = self._snapshot_mtime()
+        return max(0.0, time.time() - mtime) if mtime is not None else 0.0
+
+    @contextmanager
+    def connection(self):
+        with self._lock:
+            source = self._current_source()
+            mtime = self._snapshot_mtime() if source == self.snapshot_path else None
+            if self._pool is None or self._pool_source != source or self._pool_mtime != mtime:
+                # A refreshed snapshot is a new file; connections to the old one must go.
+                if self._pool is not None:
+                    self._pool.close()
+                self._pool = ConnectionPool(source, size=self.pool_size,
+                                            pragmas=self.pragmas, read_only=True)
+                self._pool_source = source
+                self._pool_mtime = mtime
+            pool = self._pool
+
+        with pool.connection() as conn:
+            yield conn
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.close()
+                self._pool = None
+
+class Database:
+    PRAGMA_NAMES = ('journal_mode', 'synchronous', 'cache_size', 'mmap_size', 'temp_store', 'busy_timeout')
+    BULK_CHUNK_SIZE = 500
+    # part_number in returned parts is the displayed episode number (1..n in
+    # position order); the stored part_number column is only a per-anime id.
+    PART_COLUMNS = ('id, anime_code, ROW_NUMBER() OVER (ORDER BY position, id) AS part_number, '
+                    'file_id, created_at')
+    # One anime cache, channel snapshot, code snapshot and search index per
+    # database file, shared by every Database instance in the process so a
+    # write through any of them invalidates it.
+    _caches = {}
+    _channel_snapshots = {}
+    _code_snapshots = {}
+    _search_indexes = {}
+    _caches_lock = threading.Lock()
+
+    def __init__(self, db_path='anime_bot.db', pool_size: int = DATABASE_POOL_SIZE,
+                 profile: str = DATABASE_PROFILE, write_behind: bool = WRITE_BEHIND_ENABLED):
+        if profile not in DATABASE_PROFILES:
+            raise ValueError(
+                f"Unknown database profile '{profile}', expected one of: {', '.join(DATABASE_PROFILES)}"
+            )
+
+        self.db_path = db_path
+        self.profile = profile
+        self.pool = ConnectionPool(db_path, size=pool_size, pragmas=DATABASE_PROFILES[profile])
+        self.write_buffer = WriteBehindBuffer(self) if write_behind else None
+        with Database._caches_lock:
+            self.cache = Database._caches.setdefault(
+                os.path.abspath(db_path), LRUCache(ANIME_CACHE_SIZE, ANIME_CACHE_TTL)
+            )
+            self.channel_snapshot = Database._channel_snapshots.setdefault(
+                os.path.abspath(db_path), VersionedSnapshot(CHANNEL_CACHE_CHECK_INTERVAL)
+            )
+            self.code_snapshot = Database._code_snapshots.setdefault(
+                os.path.abspath(db_path), VersionedSnapshot(ANIME_CODES_CHECK_INTERVAL)
+            )
+            self.search_index = Database._search_indexes.setdefault(os.path.abspath(db_path), TrigramIndex())
+        self.init_database()
+
+    def close(self):
+        if self.write_buffer is not None:
+            self.write_buffer.stop()
+        self.pool.close()
+
+    def get_active_settings(self) -> Dict:
+        with self.pool.connection() as conn:
+            settings = {'profile': self.profile}
+            for name in self.PRAGMA_NAMES:
+                row = conn.execute(f'PRAGMA {name}').fetchone()
+                settings[name] = row[0] if row else None
+            return settings
+
+    def init_database(self):
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS users (
+                    user_id INTEGER PRIMARY KEY,
+                    username TEXT,
+                    first_name TEXT,
+                    last_name TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+
             cursor.execute('''
-                DELETE FROM anime_parts 
-                WHERE anime_code = ? AND part_number = ?
-            ''', (anime_code, part_number))
-            
+                CREATE TABLE IF NOT EXISTS anime (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    code INTEGER UNIQUE NOT NULL,
+                    description TEXT,
+                    photo_id TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    search_key TEXT
+                )
+            ''')
+
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS anime_parts (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    anime_code INTEGER NOT NULL,
+                    part_number INTEGER NOT NULL,
+                    file_id TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    position INTEGER,
+                    FOREIGN KEY (anime_code) REFERENCES anime(code),
+                    UNIQUE(anime_code, part_number)
+                )
+            ''')
+
             cursor.execute('''
-                UPDATE anime_parts 
-                SET part_number = part_number - 1 
-                WHERE anime_code = ? AND part_number > ?
-            ''', (anime_code, part_number))
-            
+                CREATE TABLE IF NOT EXISTS groups (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    group_id INTEGER UNIQUE NOT NULL,
+                    link TEXT,
+                    name TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS anime_groups (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    anime_code INTEGER NOT NULL,
+                    group_id INTEGER NOT NULL,
+                    added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (anime_code) REFERENCES anime(code),
+                    FOREIGN KEY (group_id) REFERENCES groups(id),
+                    UNIQUE(anime_code, group_id)
+                )
+            ''')
+
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS mandatory_channels (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    channel_id TEXT UNIQUE NOT NULL,
+                    link TEXT,
+                    name TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS user_history (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER NOT NULL,
+                    anime_code INTEGER,
+                    part_number INTEGER,
+                    viewed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (user_id) REFERENCES users(user_id)
+                )
+            ''')
+
             conn.commit()
-        except Exception as e:
-            print(f"Error deleting part: {e}")
-        finally:
-            conn.close()
-    
+
+        MigrationRunner(self).run()
+
+    def add_user(self, user_id, username=None, first_name=None, last_name=None):
+        if self.write_buffer is not None:
+            self.write_buffer.touch_user(user_id, username, first_name, last_name)
+            return
+
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+
+            try:
+                cursor.execute('''
+                    INSERT OR IGNORE INTO users (user_id, username, first_name, last_name)
+                    VALUES (?, ?, ?, ?)
+                ''', (user_id, username, first_name, last_name))
+
+                cursor.execute('''
+                    UPDATE users SET last_seen = CURRENT_TIMESTAMP
+                    WHERE user_id = ?
+                ''', (user_id,))
+
+                conn.commit()
+            except Exception as e:
+                print(f"Error adding user: {e}")
+
+    def add_anime(self, code: int, description: str = None, photo_id: str = None,
+                  parts: List[Dict] = None, groups: List[int] = None):
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+
+            try:
+                cursor.execute('''
+                    INSERT INTO anime (code, description, photo_id, search_key)
+                    VALUES (?, ?, ?, ?)
+                ''', (code, description, photo_id, search_key(description)))
+
+                if parts:
+                    for part in parts:
+                        cursor.execute('''
+                            INSERT INTO anime_parts (anime_code, part_number, position, file_id)
+                            VALUES (?, ?, ?, ?)
+                        ''', (code, part['part_number'], part['part_number'] * PART_POSITION_GAP, part['file_id']))
+
+                if groups:
+                    for group_id in groups:
+                        cursor.execute('''
+                            INSERT OR IGNORE INTO anime_groups (anime_code, group_id)
+                            VALUES (?, ?)
+                        ''', (code, group_id))
+
+                conn.commit()
+            except Exception as e:
+                print(f"Error adding anime: {e}")
+
+        self.invalidate_anime(code)
+
+    def invalidate_anime(self, *codes: int, anime: bool = True, parts: bool = True):
+        keys = [('anime', code) for code in codes if anime]
+        if parts:
+            keys += [('parts', code) for code in codes] + [('part_count', code) for code in codes]
+        self.cache.invalidate(*keys)
+        if anime:
+            self.code_snapshot.invalidate()
+            self._update_search_index(codes)
+
+    def _update_search_index(self, codes):
+        if not self.search_index.built:
+            return
+        for code in codes:
+            anime = self._load_anime(code)
+            if anime:
+                self.search_index.update(code, anime['description'])
+            else:
+                self.search_index.remove(code)
+
+    def get_search_index(self) -> TrigramIndex:
+        # Built from the whole catalog on first use; writes through Database
+        # keep it current from then on.
+        with Database._caches_lock:
+            if not self.search_index.built:
+                self.search_index.build((anime['code'], anime['description']) for anime in self.get_all_anime())
+        return self.search_index
+
+    def fuzzy_search_anime(self, query: str, limit: int = 10) -> List[Anime]:
+        results = []
+        for code, _ in self.get_search_index().search(query, limit):
+            anime = self.get_anime_by_code(code)
+            if anime:
+                results.append(anime)
+        return results
+
+    def get_known_anime_codes(self) -> frozenset:
+        # Every anime code in the catalog. The data_versions counter for
+        # 'anime_codes' is bumped by triggers whenever a code appears or
+        # disappears, so the set is reloaded only then.
+        return self.code_snapshot.get(lambda: self._data_version('anime_codes'), self._load_anime_codes)
+
+    def _load_anime_codes(self) -> frozenset:
+        with self.pool.connection() as conn:
+            return frozenset(row[0] for row in conn.execute('SELECT code FROM anime'))
+
+    def anime_code_exists(self, code: int) -> bool:
+        return code in self.get_known_anime_codes()
+
+    def get_recently_viewed_codes(self, limit: int, days: int) -> List[int]:
+        # Most viewed codes of the last ``days`` only: a range scan of
+        # idx_user_history_viewed, cheap enough to run at startup. The unary
+        # + keeps the planner from scanning all history by anime_code instead.
+        with self.pool.connection() as conn:
+            return [row[0] for row in conn.execute('''
+                SELECT anime_code FROM user_history
+                WHERE viewed_at > datetime('now', ?)
+                GROUP BY +anime_code
+                ORDER BY COUNT(*) DESC
+                LIMIT ?
+            ''', (f'-{int(days)} days', limit))]
+
+    def get_cache_stats(self) -> Dict:
+        return self.cache.stats()
+
+    def get_anime_by_code(self, code: int) -> Optional[Anime]:
+        return self.cache.get_or_load(('anime', code), lambda: self._load_anime(code))
+
+    def _load_anime(self, code: int) -> Optional[Anime]:
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = Anime.row_factory
+
+            cursor.execute(f'SELECT {Anime.columns()} FROM anime WHERE code = ?', (code,))
+            return cursor.fetchone()
+
+    def get_anime_parts(self, anime_code: int) -> List[AnimePart]:
+        return list(self.cache.get_or_load(('parts', anime_code), lambda: self._load_anime_parts(anime_code)))
+
+    def _load_anime_parts(self, anime_code: int) -> tuple:
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = AnimePart.row_factory
+
+            cursor.execute(f'''
+                SELECT {self.PART_COLUMNS} FROM anime_parts
+                WHERE anime_code = ?
+                ORDER BY position, id
+            ''', (anime_code,))
+            return tuple(cursor.fetchall())
+
+    def get_parts_version(self, anime_code: int) -> tuple:
+        """Changes whenever the parts of ``anime_code`` are written."""
+        return self.cache.version(('parts', anime_code))
+
+    def get_anime_version(self, code: int) -> tuple:
+        """Changes whenever the anime row (description, photo) is written."""
+        return self.cache.version(('anime', code))
+
+    def get_anime_part_count(self, anime_code: int) -> int:
+        return self.cache.get_or_load(('part_count', anime_code), lambda: self._count_anime_parts(anime_code))
+
+    def _count_anime_parts(self, anime_code: int) -> int:
+        with self.pool.connection() as conn:
+            return conn.execute('SELECT COUNT(*) FROM anime_parts WHERE anime_code = ?', (anime_code,)).fetchone()[0]
+
+    def get_anime_parts_page(self, anime_code: int, offset: int, limit: int) -> List[AnimePart]:
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = AnimePart.row_factory
+
+            cursor.execute('''
+                SELECT id, anime_code, ? + ROW_NUMBER() OVER (ORDER BY position, id) AS part_number,
+                       file_id, created_at
+                FROM (
+                    SELECT id, anime_code, position, file_id, created_at FROM anime_parts
+                    WHERE anime_code = ?
+                    ORDER BY position, id
+                    LIMIT ? OFFSET ?
+                )
+                ORDER BY position, id
+            ''', (offset, anime_code, limit, offset))
+            return cursor.fetchall()
+
+    def get_anime_part(self, anime_code: int, part_number: int) -> Optional[AnimePart]:
+        if part_number < 1:
+            return None
+
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = AnimePart.row_factory
+
+            cursor.execute('''
+                SELECT id, anime_code, ? AS part_number, file_id, created_at FROM anime_parts
+                WHERE anime_code = ?
+                ORDER BY position, id
+                LIMIT 1 OFFSET ?
+            ''', (part_number, anime_code, part_number - 1))
+            return cursor.fetchone()
+
+    def _part_id_at(self, cursor, anime_code: int, part_number: int) -> Optional[int]:
+        if part_number < 1:
+            return None
+
+        cursor.execute('''
+            SELECT id FROM anime_parts
+            WHERE anime_code = ?
+            ORDER BY position, id
+            LIMIT 1 OFFSET ?
+        ''', (anime_code, part_number - 1))
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+    def _rebalance_parts(self, cursor, anime_code: int):
+        cursor.execute('SELECT id FROM anime_parts WHERE anime_code = ? ORDER BY position, id', (anime_code,))
+        cursor.executemany(
+            'UPDATE anime_parts SET position = ? WHERE id = ?',
+            [((index + 1) * PART_POSITION_GAP, row[0]) for index, row in enumerate(cursor.fetchall())]
+        )
+
+    def _part_position(self, cursor, anime_code: int, part_number: int, exclude_id: int = None) -> int:
+        # Position halfway between the neighbours of displayed slot
+        # ``part_number``; the series is only re-spaced once a gap runs out.
+        for _ in range(2):
+            cursor.execute('''
+                SELECT position FROM anime_parts
+                WHERE anime_code = ? AND id != ?
+                ORDER BY position, id
+                LIMIT 2 OFFSET ?
+            ''', (anime_code, exclude_id or -1, max(part_number - 2, 0)))
+            positions = [row[0] for row in cursor.fetchall()]
+
+            if not positions and part_number > 1:
+                cursor.execute('''
+                    SELECT MAX(position) FROM anime_parts WHERE anime_code = ? AND id != ?
+                ''', (anime_code, exclude_id or -1))
+                return (cursor.fetchone()[0] or 0) + PART_POSITION_GAP
+            if part_number <= 1:
+                before, after = None, (positions[0] if positions else None)
+            else:
+                before = positions[0] if positions else None
+                after = positions[1] if len(positions) > 1 else None
+
+            if after is None:
+                return (before or 0) + PART_POSITION_GAP
+            if before is None:
+                return after - PART_POSITION_GAP
+            if after - before > 1:
+                return (before + after) // 2
+
+            self._rebalance_parts(cursor, anime_code)
+
+        raise sqlite3.IntegrityError("No free position between parts")
+
+    def _insert_part(self, cursor, anime_code: int, part_number: int, file_id: str):
+        # ``part_number`` is the displayed slot; the stored number is just the
+        # next free per-anime id.
+        cursor.execute(
+            'SELECT COALESCE(MAX(part_number), 0) + 1 FROM anime_parts WHERE anime_code = ?',
+            (anime_code,)
+        )
+        stored_number = cursor.fetchone()[0]
+        position = self._part_position(cursor, anime_code, part_number)
+
+        cursor.execute('''
+            INSERT INTO anime_parts (anime_code, part_number, position, file_id)
+            VALUES (?, ?, ?, ?)
+        ''', (anime_code, stored_number, position, file_id))
+
+    def add_anime_part(self, anime_code: int, part_number: int, file_id: str):
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+
+            try:
+                self._insert_part(cursor, anime_code, part_number, file_id)
+                conn.commit()
+            except Exception as e:
+                print(f"Error adding part: {e}")
+
+        self.invalidate_anime(anime_code, anime=False)
+
+    def delete_anime_part(self, anime_code: int, part_number: int):
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+
+            try:
+                part_id = self._part_id_at(cursor, anime_code, part_number)
+                if part_id is not None:
+                    cursor.execute('DELETE FROM anime_parts WHERE id = ?', (part_id,))
+
+                conn.commit()
+            except Exception as e:
+                print(f"Error deleting part: {e}")
+
+        self.invalidate_anime(anime_code, anime=False)
+
+    def move_anime_part(self, anime_code: int, part_number: int, new_part_number: int):
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+
+            try:
+                part_id = self._part_id_at(cursor, anime_code, part_number)
+                if part_id is not None:
+                    position = self._part_position(cursor, anime_code, new_part_number, exclude_id=part_id)
+                    cursor.execute('UPDATE anime_parts SET position = ? WHERE id = ?', (position, part_id))
+
+                conn.commit()
+            except Exception as e:
+                print(f"Error moving part: {e}")
+
+        self.invalidate_anime(anime_code, anime=False)
+
     def delete_anime(self, code: int):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        try:
-            cursor.execute('DELETE FROM anime_groups WHERE anime_code = ?', (code,))
-            cursor.execute('DELETE FROM anime_parts WHERE anime_code = ?', (code,))
-            cursor.execute('DELETE FROM anime WHERE code = ?', (code,))
-            
-            conn.commit()
-        except Exception as e:
-            print(f"Error deleting anime: {e}")
-        finally:
-            conn.close()
-    
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+
+            try:
+                cursor.execute('DELETE FROM anime_groups WHERE anime_code = ?', (code,))
+                cursor.execute('DELETE FROM anime_parts WHERE anime_code = ?', (code,))
+                cursor.execute('DELETE FROM anime WHERE code = ?', (code,))
+
+                conn.commit()
+            except Exception as e:
+                print(f"Error deleting anime: {e}")
+
+        self.invalidate_anime(code)
+
     def update_anime_description(self, code: int, description: str):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        try:
-            cursor.execute('''
-                UPDATE anime 
-                SET description = ?, updated_at = CURRENT_TIMESTAMP
-                WHERE code = ?
-            ''', (description, code))
-            
-            conn.commit()
-        except Exception as e:
-            print(f"Error updating anime: {e}")
-        finally:
-            conn.close()
-    
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+
+            try:
+                cursor.execute('''
+                    UPDATE anime
+                    SET description = ?, search_key = ?, updated_at = CURRENT_TIMESTAMP
+                    WHERE code = ?
+                ''', (description, search_key(description), code))
+
+                conn.commit()
+            except Exception as e:
+                print(f"Error updating anime: {e}")
+
+        self.invalidate_anime(code, parts=False)
+
     def add_group(self, group_id: int, link: str, name: str):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        try:
-            cursor.execute('''
-                INSERT INTO groups (group_id, link, name)
-                VALUES (?, ?, ?)
-            ''', (group_id, link, name))
-            
-            conn.commit()
-        except Exception as e:
-            print(f"Error adding group: {e}")
-        finally:
-            conn.close()
-    
-    def get_all_groups(self) -> List[Dict]:
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        try:
-            cursor.execute('SELECT * FROM groups ORDER BY created_at DESC')
-            return [dict(row) for row in cursor.fetchall()]
-        finally:
-            conn.close()
-    
-    def get_group_by_id(self, group_id: int) -> Optional[Dict]:
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        try:
-            cursor.execute('SELECT * FROM groups WHERE group_id = ?', (group_id,))
-            row = cursor.fetchone()
-            return dict(row) if row else None
-        finally:
-            conn.close()
-    
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+
+            try:
+                cursor.execute('''
+                    INSERT INTO groups (group_id, link, name)
+                    VALUES (?, ?, ?)
+                ''', (group_id, link, name))
+
+                conn.commit()
+            except Exception as e:
+                print(f"Error adding group: {e}")
+
+    def get_all_groups(self) -> List[Group]:
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = Group.row_factory
+
+            cursor.execute(f'SELECT {Group.columns()} FROM groups ORDER BY created_at DESC')
+            return cursor.fetchall()
+
+    def get_group_by_id(self, group_id: int) -> Optional[Group]:
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = Group.row_factory
+
+            cursor.execute(f'SELECT {Group.columns()} FROM groups WHERE group_id = ?', (group_id,))
+            return cursor.fetchone()
+
     def delete_group(self, group_id: int):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        try:
-            cursor.execute('DELETE FROM anime_groups WHERE group_id = (SELECT id FROM groups WHERE group_id = ?)', (group_id,))
-            cursor.execute('DELETE FROM groups WHERE group_id = ?', (group_id,))
-            
-            conn.commit()
-        except Exception as e:
-            print(f"Error deleting group: {e}")
-        finally:
-            conn.close()
-    
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+
+            try:
+                cursor.execute('DELETE FROM anime_groups WHERE group_id = (SELECT id FROM groups WHERE group_id = ?)', (group_id,))
+                cursor.execute('DELETE FROM groups WHERE group_id = ?', (group_id,))
+
+                conn.commit()
+            except Exception as e:
+                print(f"Error deleting group: {e}")
+
     def add_mandatory_channel(self, channel_id: str, link: str, name: str):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        try:
-            cursor.execute('''
-                INSERT OR REPLACE INTO mandatory_channels (channel_id, link, name)
-                VALUES (?, ?, ?)
-            ''', (channel_id, link, name))
-            
-            conn.commit()
-        except Exception as e:
-            print(f"Error adding channel: {e}")
-        finally:
-            conn.close()
-    
-    def get_mandatory_channels(self) -> List[Dict]:
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        try:
-            cursor.execute('SELECT * FROM mandatory_channels')
-            return [dict(row) for row in cursor.fetchall()]
-        finally:
-            conn.close()
-    
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+
+            try:
+                cursor.execute('''
+                    INSERT OR REPLACE INTO mandatory_channels (channel_id, link, name)
+                    VALUES (?, ?, ?)
+                ''', (channel_id, link, name))
+
+                conn.commit()
+            except Exception as e:
+                print(f"Error adding channel: {e}")
+
+        self.invalidate_mandatory_channels()
+
+    def invalidate_mandatory_channels(self):
+        self.channel_snapshot.invalidate()
+
+    def get_mandatory_channels(self) -> List[Channel]:
+        # The data_versions counter is bumped by triggers on every change to
+        # mandatory_channels, whichever process or connection makes it.
+        return list(self.channel_snapshot.get(
+            lambda: self._data_version('mandatory_channels'), self._load_mandatory_channels
+        ))
+
+    def _data_version(self, name: str) -> Optional[int]:
+        with self.pool.connection() as conn:
+            row = conn.execute('SELECT version FROM data_versions WHERE name = ?', (name,)).fetchone()
+            return row[0] if row else None
+
+    def _load_mandatory_channels(self) -> tuple:
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = Channel.row_factory
+
+            cursor.execute(f'SELECT {Channel.columns()} FROM mandatory_channels')
+            return tuple(cursor.fetchall())
+
     def delete_mandatory_channel(self, channel_id):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        try:
-            cursor.execute('DELETE FROM mandatory_channels WHERE id = ?', (channel_id,))
-            conn.commit()
-        except Exception as e:
-            print(f"Error deleting channel: {e}")
-        finally:
-            conn.close()
-    
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+
+            try:
+                cursor.execute('DELETE FROM mandatory_channels WHERE id = ?', (channel_id,))
+                conn.commit()
+            except Exception as e:
+                print(f"Error deleting channel: {e}")
+
+        self.invalidate_mandatory_channels()
+
+    def set_channel_members(self, rows: List[tuple], source: str = 'api'):
+        """Upsert ``(user_id, channel_id, is_member)`` rows into channel_members.
+
+        ``source`` is ``'update'`` for rows seen in ``chat_member`` updates
+        and ``'api'`` for ``get_chat_member`` answers.
+        """
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+
+            try:
+                cursor.executemany('''
+                    INSERT INTO channel_members (user_id, channel_id, is_member, source, updated_at)
+                    VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+                    ON CONFLICT (user_id, channel_id) DO UPDATE
+                    SET is_member = excluded.is_member, source = excluded.source,
+                        updated_at = excluded.updated_at
+                ''', [(user_id, str(channel_id), int(is_member), source)
+                      for user_id, channel_id, is_member in rows])
+
+                conn.commit()
+            except Exception as e:
+                print(f"Error saving channel members: {e}")
+
+    def get_channel_memberships(self, user_id: int, channel_ids: List[str], api_max_age: float = None,
+                                api_not_member_max_age: float = None) -> Dict[str, bool]:
+        """Stored answers for ``channel_ids``.
+
+        Rows from ``chat_member`` updates are kept current by Telegram and
+        always returned; ``get_chat_member`` answers older than
+        ``api_max_age`` seconds (``api_not_member_max_age`` for "not a
+        member") are skipped so they get asked again.
+        """
+        if api_not_member_max_age is None:
+            api_not_member_max_age = api_max_age
+        if not channel_ids:
+            return {}
+
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            placeholders = ', '.join('?' * len(channel_ids))
+            cursor.execute(f'''
+                SELECT channel_id, is_member FROM channel_members
+                WHERE user_id = ? AND channel_id IN ({placeholders})
+                  AND (? IS NULL OR source = 'update'
+                       OR updated_at > datetime('now', CASE WHEN is_member THEN ? ELSE ? END))
+            ''', [user_id, *(str(channel_id) for channel_id in channel_ids), api_max_age,
+                  f'-{api_max_age or 0} seconds', f'-{api_not_member_max_age or 0} seconds'])
+            return {channel_id: bool(is_member) for channel_id, is_member in cursor.fetchall()}
+
     def add_user_history(self, user_id: int, anime_code: int, part_number: int = None):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        try:
-            cursor.execute('''
-                INSERT INTO user_history (user_id, anime_code, part_number)
-                VALUES (?, ?, ?)
-            ''', (user_id, anime_code, part_number))
-            
-            conn.commit()
-        except Exception as e:
-            print(f"Error adding history: {e}")
-        finally:
-            conn.close()
-    
+        if self.write_buffer is not None:
+            self.write_buffer.add_history(user_id, anime_code, part_number)
+            return
+
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+
+            try:
+                cursor.execute('''
+                    INSERT INTO user_history (user_id, anime_code, part_number)
+                    VALUES (?, ?, ?)
+                ''', (user_id, anime_code, part_number))
+
+                conn.commit()
+            except Exception as e:
+                print(f"Error adding history: {e}")
+
     def get_user_stats(self, user_id: int) -> Dict:
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        try:
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
+
             cursor.execute('''
                 SELECT COUNT(*) as total_views FROM user_history WHERE user_id = ?
             ''', (user_id,))
             result = cursor.fetchone()
             return dict(result) if result else {'total_views': 0}
-        finally:
-            conn.close()
-    
-    def search_anime_by_name(self, query: str) -> List[Dict]:
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        try:
-            cursor.execute('''
-                SELECT * FROM anime 
-                WHERE description LIKE ? 
-                ORDER BY created_at DESC 
-                LIMIT 20
-            ''', (f'%{query}%',))
-            return [dict(row) for row in cursor.fetchall()]
-        finally:
-            conn.close()
-    
-    def get_all_anime(self) -> List[Dict]:
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        try:
-            cursor.execute('SELECT * FROM anime ORDER BY code DESC')
-            return [dict(row) for row in cursor.fetchall()]
-        finally:
-            conn.close()
-    
+
+    @staticmethod
+    def _fts_query(query: str) -> Optional[str]:
+        # Every word of the query must match the start of a word in the
+        # title's search key; quoting keeps FTS5 operators in user input literal.
+        words = search_key(query).split()
+        return ' '.join(f'"{word}"*' for word in words) if words else None
+
+    def search_anime_by_name(self, query: str, limit: int = 20) -> List[Anime]:
+        return [anime for anime, _ in self._search_after(query, 'fts', None, limit)[0]]
+
+    def _search_after(self, query: str, mode: str, after: Optional[list], limit: int) -> Tuple[List, str]:
+        # Rows matching ``query`` that sort after ``after``, each with the
+        # sort key that continues from it: (rank, id) for anime_fts, id for
+        # the LIKE scan used when SQLite has no FTS5.
+        key = search_key(query)
+        match = self._fts_query(query)
+
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+
+            if mode == 'fts' and match:
+                keyset = 'AND (anime_fts.rank > ? OR (anime_fts.rank = ? AND a.id > ?))' if after else ''
+                try:
+                    cursor.execute(f'''
+                        SELECT {Anime.columns('a')}, anime_fts.rank FROM anime_fts
+                        JOIN anime a ON a.id = anime_fts.rowid
+                        WHERE anime_fts MATCH ? {keyset}
+                        ORDER BY anime_fts.rank, a.id
+                        LIMIT ?
+                    ''', (match, *([after[0], after[0], after[1]] if after else []), limit))
+                    return [(Anime.row_factory(cursor, row[:-1]), [row[-1], row[0]]) for row in cursor.fetchall()], mode
+                except sqlite3.OperationalError as e:
+                    print(f"Error searching anime_fts: {e}")
+                    after = None
+
+            mode = 'like'
+            cursor.execute(f'''
+                SELECT {Anime.columns()} FROM anime
+                WHERE (search_key LIKE ? OR description LIKE ?) AND id < ?
+                ORDER BY id DESC
+                LIMIT ?
+            ''', (f'%{key}%' if key else None, f'%{query}%', after[0] if after else 2 ** 63 - 1, limit))
+            return [(Anime.row_factory(cursor, row), [row[0]]) for row in cursor.fetchall()], mode
+
+    def search_anime_page(self, query: str = None, cursor: str = None,
+                          limit: int = SEARCH_PAGE_SIZE) -> Tuple[List[Anime], Optional[str]]:
+        """One page of search results and the cursor of the next page.
+
+        Call with ``query`` for the first page and with only the returned
+        ``cursor`` after that; the cursor is ``None`` on the last page. It is
+        an opaque string holding the query and the sort key of the last row,
+        so each page is one indexed query, not a re-read of earlier pages.
+        When nothing matches by name, trigram (typo-tolerant) matches are
+        paged instead.
+
+        Paging is best-effort: FTS results continue from the bm25 rank of
+        the last row, and ranks shift when the catalog changes, so an edit
+        between two pages can repeat or skip a title at the page boundary.
+        """
+        if cursor is not None:
+            try:
+                query, mode, after = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            except (ValueError, TypeError):
+                return [], None
+        else:
+            mode, after = 'fts', None
+
+        if mode == 'fuzzy':
+            matches = self.get_search_index().search(query, after + limit + 1)
+            page = [anime for anime in map(self.get_anime_by_code, (code for code, _ in matches[after:after + limit]))
+                    if anime]
+            next_after = after + limit if len(matches) > after + limit else None
+        else:
+            rows, mode = self._search_after(query, mode, after, limit + 1)
+            if not rows and after is None:
+                return self.search_anime_page(cursor=self._search_cursor(query, 'fuzzy', 0), limit=limit)
+            page = [anime for anime, _ in rows[:limit]]
+            next_after = rows[limit - 1][1] if len(rows) > limit else None
+
+        return page, self._search_cursor(query, mode, next_after) if next_after is not None else None
+
+    @staticmethod
+    def _search_cursor(query: str, mode: str, after) -> str:
+        state = json.dumps([query, mode, after], ensure_ascii=False, separators=(',', ':'))
+        return base64.urlsafe_b64encode(state.encode()).decode()
+
+    def get_all_anime(self) -> List[Anime]:
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = Anime.row_factory
+
+            cursor.execute(f'SELECT {Anime.columns()} FROM anime ORDER BY code DESC')
+            return cursor.fetchall()
+
     def get_total_anime_count(self) -> int:
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        try:
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+
             cursor.execute('SELECT COUNT(*) FROM anime')
             result = cursor.fetchone()
             return result[0] if result else 0
-        finally:
-            conn.close()
-    
+
     def get_total_parts_count(self) -> int:
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        try:
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+
             cursor.execute('SELECT COUNT(*) FROM anime_parts')
             result = cursor.fetchone()
             return result[0] if result else 0
-        finally:
-            conn.close()
-    
-    def get_anime_groups(self, anime_code: int) -> List[Dict]:
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        try:
-            cursor.execute('''
-                SELECT g.* FROM groups g
+
+    def get_anime_groups(self, anime_code: int) -> List[Group]:
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = Group.row_factory
+
+            cursor.execute(f'''
+                SELECT {Group.columns('g')} FROM groups g
                 JOIN anime_groups ag ON g.id = ag.group_id
                 WHERE ag.anime_code = ?
             ''', (anime_code,))
-            return [dict(row) for row in cursor.fetchall()]
-        finally:
-            conn.close()
-    
-    def get_all_users(self) -> List[Dict]:
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        try:
-            cursor.execute('SELECT * FROM users ORDER BY created_at DESC')
-            return [dict(row) for row in cursor.fetchall()]
-        finally:
-            conn.close()
+            return cursor.fetchall()
+
+    def get_all_users(self) -> List[User]:
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = User.row_factory
+
+            cursor.execute(f'SELECT {User.columns()} FROM users ORDER BY created_at DESC')
+            return cursor.fetchall()
+
+    @classmethod
+    def _chunks(cls, values: List) -> List[List]:
+        return [values[i:i + cls.BULK_CHUNK_SIZE] for i in range(0, len(values), cls.BULK_CHUNK_SIZE)]
+
+    def _existing_codes(self, cursor, codes: List[int]) -> set:
+        existing = set()
+        for chunk in self._chunks(codes):
+            placeholders = ', '.join('?' * len(chunk))
+            cursor.execute(f'SELECT code FROM anime WHERE code IN ({placeholders})', chunk)
+            existing.update(row[0] for row in cursor.fetchall())
+        return existing
+
+    def add_anime_bulk(self, items: List[Dict]) -> List[Dict]:
+        """Insert many anime (with their parts and groups) in one transaction.
+
+        Each item takes the same keys as ``add_anime``. Returns one
+        ``{'code', 'ok', 'error'}`` entry per item, in input order.
+        """
+        results = [{'code': item.get('code'), 'ok': False, 'error': None} for item in items]
+        accepted = {}
+
+        for result, item in zip(results, items):
+            try:
+                code = int(item.get('code'))
+            except (TypeError, ValueError):
+                result['error'] = 'invalid code'
+                continue
+
+            parts = item.get('parts') or []
+            part_numbers = [part.get('part_number') if isinstance(part, dict) else None for part in parts]
+            if not all(isinstance(number, int) and number > 0 for number in part_numbers):
+                result['error'] = 'invalid part number'
+            elif not all(part.get('file_id') for part in parts):
+                result['error'] = 'missing file_id'
+            elif len(part_numbers) != len(set(part_numbers)):
+                result['error'] = 'duplicate part number'
+            elif code in accepted:
+                result['error'] = 'duplicate code in batch'
+            else:
+                result['code'] = code
+                accepted[code] = (result, item)
+
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+
+            try:
+                for code in self._existing_codes(cursor, list(accepted)):
+                    accepted.pop(code)[0]['error'] = 'already exists'
+
+                cursor.executemany('''
+                    INSERT INTO anime (code, description, photo_id, search_key)
+                    VALUES (?, ?, ?, ?)
+                ''', [(code, item.get('description'), item.get('photo_id'), search_key(item.get('description')))
+                      for code, (_, item) in accepted.items()])
+
+                # A new anime has no parts yet, so its parts simply take slots
+                # 1..n in part_number order, as add_anime_part would give them.
+                cursor.executemany('''
+                    INSERT INTO anime_parts (anime_code, part_number, position, file_id)
+                    VALUES (?, ?, ?, ?)
+                ''', [(code, slot, slot * PART_POSITION_GAP, part['file_id'])
+                      for code, (_, item) in accepted.items()
+                      for slot, part in enumerate(
+                          sorted(item.get('parts') or [], key=lambda part: part['part_number']), 1
+                      )])
+
+                cursor.executemany('''
+                    INSERT OR IGNORE INTO anime_groups (anime_code, group_id)
+                    VALUES (?, ?)
+                ''', [(code, group_id)
+                      for code, (_, item) in accepted.items()
+                      for group_id in item.get('groups') or []])
+
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                print(f"Error adding anime in bulk: {e}")
+                for result, _ in accepted.values():
+                    result['error'] = str(e)
+                return results
+
+        for result, _ in accepted.values():
+            result['ok'] = True
+        self.invalidate_anime(*accepted)
+        return results
+
+    def add_anime_parts_bulk(self, parts: List[Dict]) -> List[Dict]:
+        """Insert many ``{'anime_code', 'part_number', 'file_id'}`` rows in one transaction.
+
+        ``part_number`` is the displayed slot, as in ``add_anime_part``: a
+        part added at an occupied slot goes before the part shown there.
+        Parts of one anime are inserted in ascending slot order.
+        """
+        results = [{'anime_code': part.get('anime_code'), 'part_number': part.get('part_number'),
+                    'ok': False, 'error': None} for part in parts]
+        accepted = {}
+
+        for result, part in zip(results, parts):
+            key = (part.get('anime_code'), part.get('part_number'))
+            if None in key or not part.get('file_id'):
+                result['error'] = 'missing field'
+            elif not all(isinstance(value, int) for value in key) or key[1] < 1:
+                result['error'] = 'invalid part number'
+            elif key in accepted:
+                result['error'] = 'duplicate part in batch'
+            else:
+                accepted[key] = (result, part)
+
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+
+            try:
+                known = self._existing_codes(cursor, list({code for code, _ in accepted}))
+
+                for key in list(accepted):
+                    if key[0] not in known:
+                        accepted.pop(key)[0]['error'] = 'anime not found'
+
+                for (code, number), (_, part) in sorted(accepted.items(), key=lambda entry: entry[0]):
+                    self._insert_part(cursor, code, number, part['file_id'])
+
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                print(f"Error adding parts in bulk: {e}")
+                for result, _ in accepted.values():
+                    result['error'] = str(e)
+                return results
+
+        for result, _ in accepted.values():
+            result['ok'] = True
+        self.invalidate_anime(*{code for code, _ in accepted}, anime=False)
+        return results
+
+    def get_anime_by_codes(self, codes: List[int]) -> Dict[int, Anime]:
+        found = {}
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = Anime.row_factory
+
+            for chunk in self._chunks(list(set(codes))):
+                placeholders = ', '.join('?' * len(chunk))
+                cursor.execute(f'SELECT {Anime.columns()} FROM anime WHERE code IN ({placeholders})', chunk)
+                found.update((anime.code, anime) for anime in cursor.fetchall())
+        return found
+
+    def get_anime_parts_by_codes(self, codes: List[int]) -> Dict[int, List[AnimePart]]:
+        unique_codes = list(set(codes))
+        parts = {code: [] for code in unique_codes}
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = AnimePart.row_factory
+
+            for chunk in self._chunks(unique_codes):
+                placeholders = ', '.join('?' * len(chunk))
+                cursor.execute(f'''
+                    SELECT id, anime_code,
+                           ROW_NUMBER() OVER (PARTITION BY anime_code ORDER BY position, id) AS part_number,
+                           file_id, created_at
+                    FROM anime_parts
+                    WHERE anime_code IN ({placeholders})
+                    ORDER BY anime_code, position, id
+                ''', chunk)
+                for part in cursor.fetchall():
+                    parts[part.anime_code].append(part)
+        return parts
+
+    def get_anime_groups_by_codes(self, codes: List[int]) -> Dict[int, List[Group]]:
+        unique_codes = list(set(codes))
+        groups = {code: [] for code in unique_codes}
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+
+            for chunk in self._chunks(unique_codes):
+                placeholders = ', '.join('?' * len(chunk))
+                cursor.execute(f'''
+                    SELECT ag.anime_code, {Group.columns('g')} FROM groups g
+                    JOIN anime_groups ag ON g.id = ag.group_id
+                    WHERE ag.anime_code IN ({placeholders})
+                ''', chunk)
+                for row in cursor.fetchall():
+                    groups[row[0]].append(Group.row_factory(cursor, row[1:]))
+        return groups
+
+class AsyncDatabase:
+    """Awaitable counterpart of ``Database`` with the same method surface.
+
+    Every call is shipped to a dedicated thread pool, so handlers never
+    block the event loop on SQLite I/O or lock waits::
+
+        db = AsyncDatabase(Database())
+        anime = await db.get_anime_by_code(12)
+
+    Concurrent calls of the hot catalog reads in ``COALESCED_READS`` with
+    the same arguments share one query; see ``flights``.
+    """
+
+    COALESCED_READS = frozenset({
+        'get_anime_by_code', 'get_anime_parts', 'get_anime_part_count',
+        'get_anime_parts_page', 'get_anime_part',
+    })
+
+    def __init__(self, db: Database = None, max_workers: int = None):
+        self.db = db if db is not None else Database()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or self.db.pool.size,
+            thread_name_prefix='database'
+        )
+        self.flights = SingleFlight('database')
+
+    @property
+    def db_path(self) -> str:
+        return self.db.db_path
+
+    # In-memory lookups, answered directly instead of through the executor.
+    def get_parts_version(self, anime_code: int) -> tuple:
+        return self.db.get_parts_version(anime_code)
+
+    def get_anime_version(self, code: int) -> tuple:
+        return self.db.get_anime_version(code)
+
+    def __getattr__(self, name):
+        attr = getattr(self.db, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        async def call(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._executor, functools.partial(attr, *args, **kwargs)
+            )
+
+        if name in self.COALESCED_READS:
+            execute = call
+
+            @functools.wraps(attr)
+            async def call(*args, **kwargs):
+                key = (name, args, tuple(sorted(kwargs.items())))
+                return await self.flights.run(key, lambda: execute(*args, **kwargs))
+
+        setattr(self, name, call)
+        return call
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self.db.close()
@@ -3,6 +3,8 @@ import sqlite3
 import sys
 from datetime import datetime
 from pathlib import Path
+from models import PART_POSITION_GAP
+from search_index import search_key
 
 if sys.platform == 'win32':
     import os
@@ -37,7 +39,7 @@ class DatabaseBackup:
                 anime_data = dict(row)
                 anime_code = anime_data['code']
                 
-                cursor.execute('SELECT * FROM anime_parts WHERE anime_code = ? ORDER BY part_number', (anime_code,))
+                cursor.execute('SELECT * FROM anime_parts WHERE anime_code = ? ORDER BY position, id', (anime_code,))
                 parts = [dict(p) for p in cursor.fetchall()]
                 
                 anime_data['parts'] = parts
@@ -72,23 +74,25 @@ class DatabaseBackup:
                 
                 try:
                     cursor.execute('''
-                        INSERT OR REPLACE INTO anime (code, description, photo_id, created_at, updated_at)
-                        VALUES (?, ?, ?, ?, ?)
+                        INSERT OR REPLACE INTO anime (code, description, photo_id, created_at, updated_at, search_key)
+                        VALUES (?, ?, ?, ?, ?, ?)
                     ''', (
                         anime['code'],
                         anime.get('description'),
                         anime.get('photo_id'),
                         anime.get('created_at'),
-                        anime.get('updated_at')
+                        anime.get('updated_at'),
+                        search_key(anime.get('description'))
                     ))
                     
                     for part in parts:
                         cursor.execute('''
-                            INSERT OR REPLACE INTO anime_parts (anime_code, part_number, file_id, created_at)
-                            VALUES (?, ?, ?, ?)
+                            INSERT OR REPLACE INTO anime_parts (anime_code, part_number, position, file_id, created_at)
+                            VALUES (?, ?, ?, ?, ?)
                         ''', (
                             part['anime_code'],
                             part['part_number'],
+                            part.get('position') or part['part_number'] * PART_POSITION_GAP,
                             part['file_id'],
                             part.get('created_at')
                         ))
@@ -110,6 +114,12 @@ class DatabaseBackup:
                 except Exception as e:
                     print(f"[WARN] Guruh import: {e}")
             
+            # INSERT OR REPLACE does not fire the anime_fts delete trigger
+            try:
+                cursor.execute("INSERT INTO anime_fts (anime_fts) VALUES ('rebuild')")
+            except sqlite3.OperationalError as e:
+                print(f"[WARN] anime_fts qayta qurilmadi: {e}")
+            
             conn.commit()
             print(f"[OK] Import qilindi: {input_file}")
             return True
@@ -117,14 +127,25 @@ class DatabaseBackup:
         finally:
             conn.close()
     
+    def copy_database(self, target_path):
+        """WAL rejimida ham to'liq nusxa olish (SQLite backup API)"""
+        source = sqlite3.connect(self.db_path)
+        target = sqlite3.connect(target_path)
+        
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+        
+        return target_path
+    
     def create_full_backup(self):
         """Database va JSON backup"""
-        import shutil
-        
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         
         db_backup = f'backups/anime_bot_{timestamp}.db'
-        shutil.copy(self.db_path, db_backup)
+        self.copy_database(db_backup)
         print(f"[OK] Database backup: {db_backup}")
         
         json_backup = self.export_all_to_json()
@@ -3,6 +3,9 @@ from telegram.ext import ContextTypes
 from database import Database
 from admin_utils import AdminUtils
 from config import ADMIN_IDS
+from subscription import get_membership_stats
+from cache import get_coalescing_stats
+from utils import TextFormatting
 import asyncio
 
 class ExtendedFeatures:
@@ -74,6 +77,9 @@ class ExtendedFeatures:
             return
         
         stats = self.admin_utils.get_bot_statistics()
+        membership = get_membership_stats()
+        coalescing = get_coalescing_stats()
+        coalesced = ", ".join(f"{name}: {flight['coalesced']}/{flight['calls']}" for name, flight in coalescing.items())
         
         text = f"""
 ⚙️ <b>Bot Statistikasi</b>
@@ -82,6 +88,9 @@ class ExtendedFeatures:
 📺 Animeler: {stats['total_anime']}
 🎬 Qismlar: {stats['total_parts']}
 📍 Guruhlar: {stats['total_groups']}
+⚡ Kesh: {stats['cache']['hit_rate']:.0%} ({stats['cache']['hits']} hit / {stats['cache']['misses']} miss)
+🔐 Obuna keshi: {membership['hit_rate']:.0%} ({membership['hits']} hit / {membership['misses']} miss, baza: {membership['local_hits']}, API: {membership['api_calls']})
+🔀 Birlashtirilgan so'rovlar: {sum(flight['coalesced'] for flight in coalescing.values())} ({coalesced or '-'})
 
 🕐 O'zgartirilgan vaqt: {stats['timestamp']}
         """
@@ -95,7 +104,7 @@ class ExtendedFeatures:
             await update.message.reply_text("❌ Siz admin emassiz!")
             return
         
-        report = self.admin_utils.get_user_activity_report(days=30)
+        report = await asyncio.to_thread(self.admin_utils.get_user_activity_report, days=30)
         
         text = f"""
 📊 <b>Faoliyat Hisoboti (30 kun)</b>
@@ -108,6 +117,8 @@ class ExtendedFeatures:
         for day in report['daily_activity'][:10]:
             text += f"\n📅 {day['date']}: {day['views']} ko'rish"
         
+        text += f"\n\n{TextFormatting.format_snapshot_age(report['snapshot_age'])}"
+        
         await update.message.reply_text(text, parse_mode='HTML')
     
     async def send_top_anime(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -117,13 +128,15 @@ class ExtendedFeatures:
             await update.message.reply_text("❌ Siz admin emassiz!")
             return
         
-        top_anime = self.admin_utils.get_most_viewed_anime(limit=15)
+        top_anime = await asyncio.to_thread(self.admin_utils.get_most_viewed_anime, limit=15)
         
         text = "<b>🔥 Eng Ko'p Ko'rilgan Animeler</b>\n\n"
         
         for idx, anime in enumerate(top_anime, 1):
             text += f"{idx}. {anime['description'][:50]}... - {anime['view_count']} ko'rish\n"
         
+        text += f"\n{TextFormatting.format_snapshot_age(self.admin_utils.analytics.snapshot_age())}"
+        
         await update.message.reply_text(text, parse_mode='HTML')
     
     async def backup_database(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -133,13 +146,13 @@ class ExtendedFeatures:
             await update.message.reply_text("❌ Siz admin emassiz!")
             return
         
-        import shutil
         from datetime import datetime
+        from database_backup import DatabaseBackup
         
         backup_name = f"anime_bot_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.db"
         
         try:
-            shutil.copy(self.db.db_path, backup_name)
+            DatabaseBackup(self.db.db_path).copy_database(backup_name)
             
             with open(backup_name, 'rb') as f:
                 await context.bot.send_document(
@@ -185,12 +198,4 @@ class ExtendedFeatures:
         )
     
     def get_all_users(self) -> list:
-        conn = __import__('sqlite3').connect(self.db.db_path)
-        conn.row_factory = __import__('sqlite3').Row
-        cursor = conn.cursor()
-        
-        try:
-            cursor.execute('SELECT * FROM users')
-            return [dict(row) for row in cursor.fetchall()]
-        finally:
-            conn.close()
+        return self.db.get_all_users()
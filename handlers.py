@@ -1,6 +1,6 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler
-from database import Database
+from database import Database, AsyncDatabase
 from config import ADMIN_IDS
 from utils import ValidationUtils, ErrorMessages, LoggerUtils, PaginationUtils
 from middleware import session_middleware, rate_limit_middleware, error_handler_middleware
@@ -41,20 +41,20 @@ class GeneralHandlers:
 
 class SearchHandlers:
     def __init__(self):
-        self.db = Database()
+        self.db = AsyncDatabase(Database())
     
     async def handle_search(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-        user_id = update.effective_user.id
-        
-        query = update.message.text.strip()
-        
+        await self.search(update, context, update.message.text.strip())
+    
+    async def search(self, update: Update, context: ContextTypes.DEFAULT_TYPE, query: str):
         if len(query) < 2:
             await update.message.reply_text(
                 "🔍 Kamida 2 belgi yuboring!"
             )
             return
         
-        results = self.db.search_anime_by_name(query)
+        # Only the cursor of the next page is kept per user, not the results
+        results, cursor = await self.db.search_anime_page(query)
         
         if not results:
             await update.message.reply_text(
@@ -62,24 +62,42 @@ class SearchHandlers:
             )
             return
         
-        context.user_data['search_results'] = results
-        context.user_data['search_page'] = 0
+        context.user_data['search_cursor'] = cursor
+        
+        await update.message.reply_text(
+            f"🔍 '{query}' bo'yicha natijalar:",
+            reply_markup=self.results_keyboard(results, cursor)
+        )
+    
+    async def handle_search_next(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        query = update.callback_query
+        await query.answer()
+        
+        cursor = context.user_data.get('search_cursor')
+        results, cursor = await self.db.search_anime_page(cursor=cursor) if cursor else ([], None)
+        context.user_data['search_cursor'] = cursor
+        
+        if not results:
+            await query.edit_message_text("🔍 Boshqa natija yo'q!")
+            return
         
+        await query.edit_message_reply_markup(reply_markup=self.results_keyboard(results, cursor))
+    
+    @staticmethod
+    def results_keyboard(results: list, cursor: str = None) -> InlineKeyboardMarkup:
         keyboard = []
-        for idx, anime in enumerate(results[:5]):
+        for anime in results:
             keyboard.append([
                 InlineKeyboardButton(
                     anime['description'][:50] if anime['description'] else f"Kod: {anime['code']}",
-                    callback_data=f"search_select_{idx}"
+                    callback_data=f"search_select_{anime['code']}"
                 )
             ])
         
-        keyboard.append([InlineKeyboardButton("📄 Ko'proq", callback_data="search_next")])
+        if cursor:
+            keyboard.append([InlineKeyboardButton("📄 Ko'proq", callback_data="search_next")])
         
-        await update.message.reply_text(
-            f"🔍 Natijalar ({len(results)} ta):",
-            reply_markup=InlineKeyboardMarkup(keyboard)
-        )
+        return InlineKeyboardMarkup(keyboard)
 
 class NotificationHandlers:
     def __init__(self):
@@ -98,13 +116,13 @@ class NotificationHandlers:
 
 class AnalyticsHandlers:
     def __init__(self):
-        self.db = Database()
+        self.db = AsyncDatabase(Database())
     
     async def track_view(self, user_id: int, anime_code: int, part_number: int = None):
-        self.db.add_user_history(user_id, anime_code, part_number)
+        await self.db.add_user_history(user_id, anime_code, part_number)
     
     async def get_user_stats(self, user_id: int) -> dict:
-        return self.db.get_user_stats(user_id)
+        return await self.db.get_user_stats(user_id)
 
 class CallbackHandlers:
     def __init__(self):
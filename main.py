@@ -1,14 +1,18 @@
+import asyncio
 import logging
 import os
 import sys
+import time
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, ConversationHandler, filters, ContextTypes
-from bot import AnimeBot
+from bot import AnimeBot, db as bot_db
 from database import Database
+from migrations import verify_query_plans
 from admin_utils import AdminUtils
 from extended_features import ExtendedFeatures
+from handlers import SearchHandlers
 from database_backup import DatabaseBackup
-from config import TOKEN, ADMIN_IDS, MANDATORY_CHANNELS
+from config import TOKEN, ADMIN_IDS, MANDATORY_CHANNELS, WARMUP_ENABLED, WARMUP_TOP_N, WARMUP_TIME_BUDGET, WARMUP_HISTORY_DAYS
 
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -22,12 +26,25 @@ class AnimeBotMain:
         self.backup.auto_backup_on_startup()
         
         self.db = Database()
+        self.log_database_settings()
         self.admin_utils = AdminUtils()
         self.extended = ExtendedFeatures()
+        self.search_handlers = SearchHandlers()
         self.anime_bot = AnimeBot()
         self.app = self.anime_bot.app
         self.setup_additional_handlers()
         self.init_mandatory_channels()
+        if WARMUP_ENABLED:
+            self.warm_up_caches()
+    
+    def log_database_settings(self):
+        settings = self.db.get_active_settings()
+        details = ", ".join(f"{name}={value}" for name, value in settings.items())
+        logger.info(f"SQLite sozlamalari: {details}")
+        
+        for name, result in verify_query_plans(self.db).items():
+            if not result['uses_index']:
+                logger.warning(f"{name} so'rovi {result['index']} indeksidan foydalanmayapti: {result['plan']}")
     
     def init_mandatory_channels(self):
         existing = self.db.get_mandatory_channels()
@@ -39,6 +56,25 @@ class AnimeBotMain:
                     channel['name']
                 )
     
+    def warm_up_caches(self):
+        # Preload the most viewed anime so the first users after a restart
+        # hit warm caches. Runs on its own event loop before polling starts
+        # and stops at WARMUP_TIME_BUDGET, whatever is left stays cold.
+        started = time.monotonic()
+        try:
+            loop = asyncio.new_event_loop()
+            try:
+                warmed = loop.run_until_complete(
+                    self.anime_bot.warm_up(WARMUP_TOP_N, WARMUP_HISTORY_DAYS, started + WARMUP_TIME_BUDGET)
+                )
+            finally:
+                loop.close()
+        except Exception as e:
+            logger.warning(f"Keshni isitishda xato: {e}")
+            return
+        
+        logger.info(f"Kesh isitildi: {warmed} anime, {time.monotonic() - started:.2f}s")
+    
     def setup_additional_handlers(self):
         self.app.add_handler(CommandHandler("stats", self.stats_command))
         self.app.add_handler(CommandHandler("analytics", self.analytics_command))
@@ -46,6 +82,7 @@ class AnimeBotMain:
         self.app.add_handler(CommandHandler("backup", self.backup_command))
         self.app.add_handler(CommandHandler("export", self.export_command))
         self.app.add_handler(CommandHandler("search", self.search_command))
+        self.app.add_handler(CallbackQueryHandler(self.search_handlers.handle_search_next, pattern="^search_next$"))
         self.app.add_handler(CommandHandler("groups", self.groups_command))
         self.app.add_handler(CommandHandler("broadcast", self.broadcast_command))
         self.app.add_handler(CommandHandler("test", self.test_command))
@@ -121,6 +158,10 @@ class AnimeBotMain:
         await self.extended.export_anime_list(update, context)
     
     async def search_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if context.args:
+            await self.search_handlers.search(update, context, ' '.join(context.args))
+            return
+        
         await update.message.reply_text(
             "🔍 Anime nomini yuboring:"
         )
@@ -184,7 +225,11 @@ class AnimeBotMain:
         logger.info("Bot ishga tushmoqda...")
         print("[*] Anime Bot ishga tushdi!")
         print("[*] Bot ishga tushdi va polling boshlanmoqda...")
-        self.app.run_polling()
+        try:
+            self.app.run_polling(allowed_updates=Update.ALL_TYPES)
+        finally:
+            bot_db.close()
+            self.db.close()
 
 if __name__ == '__main__':
     if not TOKEN or TOKEN == 'YOUR_BOT_TOKEN_HERE':
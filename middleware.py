@@ -1,12 +1,15 @@
+import time
 from telegram import Update
 from telegram.ext import ContextTypes
-from database import Database
+from cache import LRUCache
+from database import Database, AsyncDatabase
 from utils import LoggerUtils
+from config import CODE_MISS_LIMIT, CODE_MISS_WINDOW, CODE_MISS_TRACKED_USERS
 from datetime import datetime, timedelta
 
 class UserSessionMiddleware:
     def __init__(self):
-        self.db = Database()
+        self.db = AsyncDatabase(Database())
         self.sessions = {}
     
     async def track_user(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -15,7 +18,7 @@ class UserSessionMiddleware:
         if user:
             user_id = user.id
             
-            self.db.add_user(
+            await self.db.add_user(
                 user_id,
                 username=user.username,
                 first_name=user.first_name,
@@ -204,6 +207,51 @@ class ContextPreservationMiddleware:
             if not self.context_storage[user_id]:
                 del self.context_storage[user_id]
 
+class CodeMissGuard:
+    """Throttles users who keep sending anime codes that do not exist.
+
+    Misses are counted per user in fixed windows of ``time_window``
+    seconds; a user with ``max_misses`` misses in the current window is
+    turned away before any subscription check or database lookup; only
+    the first of those messages gets a notice. Only the ``max_users`` most
+    recent offenders are tracked.
+    """
+    
+    def __init__(self, max_misses: int = CODE_MISS_LIMIT, time_window: float = CODE_MISS_WINDOW,
+                 max_users: int = CODE_MISS_TRACKED_USERS):
+        self.max_misses = max_misses
+        self.time_window = time_window
+        self.misses = LRUCache(max_users, time_window)
+        self.throttled = 0
+    
+    def is_throttled(self, user_id: int) -> bool:
+        entry = self.misses.get(user_id)
+        if entry is not None and entry[1] >= self.max_misses:
+            self.throttled += 1
+            return True
+        return False
+    
+    def take_notice(self, user_id: int) -> bool:
+        """True once per window for a throttled user; later messages are dropped silently."""
+        entry = self.misses.get(user_id)
+        if entry is None or entry[2]:
+            return False
+        started, count, _ = entry
+        self.misses.put(user_id, (started, count, True), ttl=started + self.time_window - time.monotonic())
+        return True
+    
+    def record_miss(self, user_id: int):
+        now = time.monotonic()
+        entry = self.misses.get(user_id)
+        if entry is None:
+            self.misses.put(user_id, (now, 1, False))
+        else:
+            started, count, notified = entry
+            self.misses.put(user_id, (started, count + 1, notified), ttl=started + self.time_window - now)
+    
+    def stats(self) -> dict:
+        return {'tracked_users': self.misses.stats()['size'], 'throttled': self.throttled}
+
 session_middleware = UserSessionMiddleware()
 rate_limit_middleware = RateLimitMiddleware()
 error_handler_middleware = ErrorHandlerMiddleware()
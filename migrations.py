@@ -0,0 +1,446 @@
+import sys
+import time
+from typing import Callable, Dict, List, Optional
+from models import PART_POSITION_GAP
+from config import MIGRATION_BATCH_SIZE, MIGRATION_BATCH_PAUSE
+
+class Migration:
+    """One schema version; applied once and recorded in ``PRAGMA user_version``.
+
+    A migration is a list of steps run in order. Every step is idempotent,
+    so a migration interrupted half-way is simply run again on the next
+    start and picks up where it stopped.
+    """
+
+    def __init__(self, version: int, description: str, steps: List = None):
+        self.version = version
+        self.description = description
+        self.steps = steps or []
+
+    def apply(self, db, report: Callable[[str], None]):
+        for step in self.steps:
+            step.run(db, report)
+
+class CreateTable:
+    def __init__(self, name: str, definition: str):
+        self.name = name
+        self.definition = definition
+
+    def run(self, db, report: Callable[[str], None]):
+        with db.pool.connection() as conn:
+            conn.execute(f'CREATE TABLE IF NOT EXISTS {self.name} ({self.definition})')
+            conn.commit()
+        report(f"{self.name} jadvali")
+
+def fts5_available(conn) -> bool:
+    try:
+        conn.execute('CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)')
+        conn.execute('DROP TABLE temp.fts5_probe')
+        return True
+    except Exception:
+        return False
+
+class Execute:
+    """Runs statements in order, then commits.
+
+    Python's sqlite3 commits ``CREATE``/``DROP`` as they run, so this is not
+    one transaction: every statement must be idempotent (``IF NOT EXISTS``,
+    ``OR IGNORE``) for a rerun after a crash. When ``requires(conn)`` is
+    false the step is skipped.
+    """
+
+    def __init__(self, description: str, statements: List[str], requires: Callable = None):
+        self.description = description
+        self.statements = statements
+        self.requires = requires
+
+    def run(self, db, report: Callable[[str], None]):
+        with db.pool.connection() as conn:
+            if self.requires is not None and not self.requires(conn):
+                report(f"{self.description}: o'tkazib yuborildi")
+                return
+            for statement in self.statements:
+                conn.execute(statement)
+            conn.commit()
+        report(self.description)
+
+class AddColumn:
+    """``ALTER TABLE ... ADD COLUMN`` unless the column already exists.
+
+    SQLite only rewrites the table header here, so this is instant even on
+    a large table; fill existing rows with a ``Backfill`` step if the column
+    has no constant default.
+    """
+
+    def __init__(self, table: str, column: str, definition: str):
+        self.table = table
+        self.column = column
+        self.definition = definition
+
+    def run(self, db, report: Callable[[str], None]):
+        with db.pool.connection() as conn:
+            columns = {row[1] for row in conn.execute(f'PRAGMA table_info({self.table})')}
+            if self.column in columns:
+                return
+            conn.execute(f'ALTER TABLE {self.table} ADD COLUMN {self.column} {self.definition}')
+            conn.commit()
+        report(f"{self.table}.{self.column} ustuni qo'shildi")
+
+class CreateIndexes:
+    """Builds indexes one at a time so no single write lock is held for long.
+
+    SQLite cannot build one index incrementally, so each ``CREATE INDEX``
+    runs in its own short transaction and the builder pauses between them,
+    letting queued writers from the bot get through.
+    """
+
+    def __init__(self, indexes: List[tuple], pause: float = 0.05):
+        self.indexes = indexes
+        self.pause = pause
+
+    def run(self, db, report: Callable[[str], None]):
+        total = len(self.indexes)
+        for step, (name, table, columns) in enumerate(self.indexes, 1):
+            started = time.monotonic()
+            with db.pool.connection() as conn:
+                conn.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({", ".join(columns)})')
+                conn.commit()
+            report(f"{step}/{total} {name} ({time.monotonic() - started:.2f}s)")
+            time.sleep(self.pause)
+
+class Backfill:
+    """Runs an ``UPDATE`` or ``INSERT ... SELECT`` over a table in rowid ranges.
+
+    ``sql`` must contain ``:start`` and ``:end`` and restrict itself to
+    ``rowid > :start AND rowid <= :end`` of ``table``. Each range is one
+    short transaction that also stores the last finished rowid in
+    ``migration_progress``; after a crash or restart the backfill resumes
+    from that checkpoint instead of starting over. ``MAX(rowid)`` is read
+    again once the known range is done, so rows the bot inserts while the
+    backfill runs are covered too.
+    """
+
+    def __init__(self, name: str, table: str, sql: str, params: Dict = None,
+                 batch_size: int = MIGRATION_BATCH_SIZE, pause: float = MIGRATION_BATCH_PAUSE):
+        self.name = name
+        self.table = table
+        self.sql = sql
+        self.params = params or {}
+        self.batch_size = max(1, batch_size)
+        self.pause = pause
+
+    def run(self, db, report: Callable[[str], None]):
+        with db.pool.connection() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS migration_progress (
+                    name TEXT PRIMARY KEY,
+                    last_rowid INTEGER NOT NULL,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            conn.commit()
+            row = conn.execute('SELECT last_rowid FROM migration_progress WHERE name = ?',
+                               (self.name,)).fetchone()
+            start = row[0] if row else 0
+            max_rowid = self._max_rowid(conn)
+
+        if start:
+            report(f"{self.name}: {start}/{max_rowid} dan davom etilmoqda")
+
+        started = time.monotonic()
+        while True:
+            if start >= max_rowid:
+                with db.pool.connection() as conn:
+                    max_rowid = self._max_rowid(conn)
+                if start >= max_rowid:
+                    break
+            end = min(start + self.batch_size, max_rowid)
+            with db.pool.connection() as conn:
+                try:
+                    conn.execute(self.sql, {**self.params, 'start': start, 'end': end})
+                    conn.execute('''
+                        INSERT OR REPLACE INTO migration_progress (name, last_rowid, updated_at)
+                        VALUES (?, ?, CURRENT_TIMESTAMP)
+                    ''', (self.name, end))
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+            start = end
+            report(f"{self.name}: {end}/{max_rowid} ({end * 100 // max_rowid}%, "
+                   f"{time.monotonic() - started:.1f}s)")
+            time.sleep(self.pause)
+
+        with db.pool.connection() as conn:
+            conn.execute('DELETE FROM migration_progress WHERE name = ?', (self.name,))
+            conn.commit()
+
+    def _max_rowid(self, conn) -> int:
+        return conn.execute(f'SELECT COALESCE(MAX(rowid), 0) FROM {self.table}').fetchone()[0]
+
+INDEXES = [
+    ('idx_user_history_user_anime', 'user_history', ('user_id', 'anime_code')),
+    ('idx_user_history_anime', 'user_history', ('anime_code',)),
+    ('idx_user_history_viewed', 'user_history', ('viewed_at', 'user_id')),
+    ('idx_users_last_seen', 'users', ('last_seen',)),
+    ('idx_anime_groups_group', 'anime_groups', ('group_id',)),
+]
+
+MIGRATIONS = [
+    Migration(1, "user_history, users va anime_groups indekslari", [
+        CreateIndexes(INDEXES),
+    ]),
+    Migration(2, "anime_parts.position tartib ustuni", [
+        AddColumn('anime_parts', 'position', 'INTEGER'),
+        Backfill(
+            'anime_parts.position', 'anime_parts',
+            '''
+            UPDATE anime_parts SET position = part_number * :gap
+            WHERE rowid > :start AND rowid <= :end AND position IS NULL
+            ''',
+            {'gap': PART_POSITION_GAP}
+        ),
+        CreateIndexes([('idx_anime_parts_position', 'anime_parts', ('anime_code', 'position'))]),
+    ]),
+    Migration(3, "users.blocked va anime_reports", [
+        AddColumn('users', 'blocked', 'INTEGER DEFAULT 0'),
+        CreateTable('anime_reports', '''
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            anime_code INTEGER NOT NULL,
+            reason TEXT,
+            reported_by INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            status TEXT DEFAULT 'pending'
+        '''),
+        CreateIndexes([('idx_anime_reports_status', 'anime_reports', ('status',))]),
+    ]),
+    Migration(4, "mandatory_channels o'zgarish hisoblagichi", [
+        CreateTable('data_versions', '''
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        '''),
+        Execute("mandatory_channels triggerlari", [
+            "INSERT OR IGNORE INTO data_versions (name, version) VALUES ('mandatory_channels', 0)",
+        ] + [
+            f'''
+            CREATE TRIGGER IF NOT EXISTS trg_mandatory_channels_{event.lower()}
+            AFTER {event} ON mandatory_channels
+            BEGIN
+                UPDATE data_versions SET version = version + 1 WHERE name = 'mandatory_channels';
+            END
+            '''
+            for event in ('INSERT', 'UPDATE', 'DELETE')
+        ]),
+    ]),
+    Migration(5, "channel_members obuna jadvali", [
+        CreateTable('channel_members', '''
+            user_id INTEGER NOT NULL,
+            channel_id TEXT NOT NULL,
+            is_member INTEGER NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, channel_id)
+        '''),
+    ]),
+    Migration(6, "anime kodlari o'zgarish hisoblagichi", [
+        Execute("anime kod triggerlari", [
+            "INSERT OR IGNORE INTO data_versions (name, version) VALUES ('anime_codes', 0)",
+        ] + [
+            f'''
+            CREATE TRIGGER IF NOT EXISTS trg_anime_codes_{event.split()[0].lower()}
+            AFTER {event} ON anime
+            BEGIN
+                UPDATE data_versions SET version = version + 1 WHERE name = 'anime_codes';
+            END
+            '''
+            for event in ('INSERT', 'UPDATE OF code', 'DELETE')
+        ]),
+    ]),
+    Migration(7, "anime_fts to'liq matnli qidiruv indeksi", [
+        # Without FTS5 this is skipped and name search uses the LIKE fallback
+        Execute("anime_fts jadvali va triggerlari", [
+            '''
+            CREATE VIRTUAL TABLE IF NOT EXISTS anime_fts USING fts5(
+                description, content='anime', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2'
+            )
+            ''',
+            '''
+            CREATE TRIGGER IF NOT EXISTS trg_anime_fts_insert AFTER INSERT ON anime
+            BEGIN
+                INSERT INTO anime_fts (rowid, description) VALUES (new.id, new.description);
+            END
+            ''',
+            '''
+            CREATE TRIGGER IF NOT EXISTS trg_anime_fts_delete AFTER DELETE ON anime
+            BEGIN
+                INSERT INTO anime_fts (anime_fts, rowid, description) VALUES ('delete', old.id, old.description);
+            END
+            ''',
+            '''
+            CREATE TRIGGER IF NOT EXISTS trg_anime_fts_update AFTER UPDATE OF description ON anime
+            BEGIN
+                INSERT INTO anime_fts (anime_fts, rowid, description) VALUES ('delete', old.id, old.description);
+                INSERT INTO anime_fts (rowid, description) VALUES (new.id, new.description);
+            END
+            ''',
+            # Index the rows that existed before the triggers. 'rebuild'
+            # re-reads all of anime, so rows a trigger already indexed are
+            # not indexed twice.
+            "INSERT INTO anime_fts (anime_fts) VALUES ('rebuild')",
+        ], requires=fts5_available),
+    ]),
+    Migration(8, "anime.search_key yozuvdan mustaqil qidiruv kaliti", [
+        AddColumn('anime', 'search_key', 'TEXT'),
+        # search_key() is the Python function every pool connection registers
+        Backfill(
+            'anime.search_key', 'anime',
+            '''
+            UPDATE anime SET search_key = search_key(description)
+            WHERE rowid > :start AND rowid <= :end AND search_key IS NULL
+            '''
+        ),
+        Execute("anime_fts search_key bo'yicha qayta qurildi", [
+            'DROP TRIGGER IF EXISTS trg_anime_fts_insert',
+            'DROP TRIGGER IF EXISTS trg_anime_fts_delete',
+            'DROP TRIGGER IF EXISTS trg_anime_fts_update',
+            'DROP TABLE IF EXISTS anime_fts',
+            '''
+            CREATE VIRTUAL TABLE anime_fts USING fts5(
+                search_key, content='anime', content_rowid='id'
+            )
+            ''',
+            '''
+            CREATE TRIGGER trg_anime_fts_insert AFTER INSERT ON anime
+            BEGIN
+                INSERT INTO anime_fts (rowid, search_key) VALUES (new.id, new.search_key);
+            END
+            ''',
+            '''
+            CREATE TRIGGER trg_anime_fts_delete AFTER DELETE ON anime
+            BEGIN
+                INSERT INTO anime_fts (anime_fts, rowid, search_key) VALUES ('delete', old.id, old.search_key);
+            END
+            ''',
+            '''
+            CREATE TRIGGER trg_anime_fts_update AFTER UPDATE OF search_key ON anime
+            BEGIN
+                INSERT INTO anime_fts (anime_fts, rowid, search_key) VALUES ('delete', old.id, old.search_key);
+                INSERT INTO anime_fts (rowid, search_key) VALUES (new.id, new.search_key);
+            END
+            ''',
+            "INSERT INTO anime_fts (anime_fts) VALUES ('rebuild')",
+        ], requires=fts5_available),
+    ]),
+    Migration(9, "channel_members.source javob manbasi", [
+        # Rows stored so far cannot be told apart; treat them as API answers
+        AddColumn('channel_members', 'source', "TEXT NOT NULL DEFAULT 'api'"),
+    ]),
+]
+
+HOT_QUERIES = {
+    'user_stats': (
+        'SELECT COUNT(*) FROM user_history WHERE user_id = ?',
+        (0,), 'idx_user_history_user_anime'
+    ),
+    'user_watched_anime': (
+        'SELECT DISTINCT anime_code FROM user_history WHERE user_id = ?',
+        (0,), 'idx_user_history_user_anime'
+    ),
+    'anime_views': (
+        'SELECT COUNT(*) FROM user_history WHERE anime_code = ?',
+        (0,), 'idx_user_history_anime'
+    ),
+    'most_viewed_anime': (
+        '''
+        SELECT a.code, a.description, COUNT(uh.id) as view_count
+        FROM anime a
+        LEFT JOIN user_history uh ON a.code = uh.anime_code
+        GROUP BY a.code
+        ORDER BY view_count DESC
+        LIMIT ?
+        ''',
+        (10,), 'idx_user_history_anime'
+    ),
+    'activity_report': (
+        '''
+        SELECT DATE(viewed_at) as date, COUNT(*) as views
+        FROM user_history
+        WHERE viewed_at > ?
+        GROUP BY DATE(viewed_at)
+        ''',
+        ('',), 'idx_user_history_viewed'
+    ),
+    'cleanup_old_history': (
+        'DELETE FROM user_history WHERE viewed_at < ?',
+        ('',), 'idx_user_history_viewed'
+    ),
+    'active_users': (
+        'SELECT COUNT(*) FROM users WHERE last_seen > ?',
+        ('',), 'idx_users_last_seen'
+    ),
+    'anime_parts': (
+        'SELECT id FROM anime_parts WHERE anime_code = ? ORDER BY position, id',
+        (0,), 'idx_anime_parts_position'
+    ),
+    'group_anime_count': (
+        'SELECT COUNT(*) FROM anime_groups WHERE group_id = ?',
+        (0,), 'idx_anime_groups_group'
+    ),
+}
+
+class MigrationRunner:
+    def __init__(self, db, migrations: List[Migration] = None,
+                 report: Optional[Callable[[str], None]] = None):
+        self.db = db
+        self.migrations = sorted(migrations if migrations is not None else MIGRATIONS,
+                                 key=lambda m: m.version)
+        self.report = report or (lambda message: print(f"[MIGRATION] {message}"))
+
+    def get_version(self) -> int:
+        with self.db.pool.connection() as conn:
+            return conn.execute('PRAGMA user_version').fetchone()[0]
+
+    def set_version(self, version: int):
+        with self.db.pool.connection() as conn:
+            conn.execute(f'PRAGMA user_version = {int(version)}')
+            conn.commit()
+
+    def pending(self) -> List[Migration]:
+        current = self.get_version()
+        return [m for m in self.migrations if m.version > current]
+
+    def run(self) -> List[int]:
+        applied = []
+        for migration in self.pending():
+            self.report(f"v{migration.version}: {migration.description}")
+            migration.apply(
+                self.db,
+                lambda message, v=migration.version: self.report(f"v{v}: {message}")
+            )
+            self.set_version(migration.version)
+            applied.append(migration.version)
+        return applied
+
+def verify_query_plans(db, queries: Dict = None) -> Dict[str, Dict]:
+    results = {}
+    with db.pool.connection() as conn:
+        for name, (sql, params, index_name) in (queries or HOT_QUERIES).items():
+            plan = [row[-1] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()]
+            results[name] = {
+                'index': index_name,
+                'uses_index': any(f'INDEX {index_name} ' in f'{detail} ' for detail in plan),
+                'plan': plan,
+            }
+    return results
+
+if __name__ == '__main__':
+    # Safe to run against the database of a bot that is still serving: every
+    # step works in short transactions, and Database() applies what is pending.
+    from database import Database
+
+    db = Database(sys.argv[1] if len(sys.argv) > 1 else 'anime_bot.db', write_behind=False)
+    print(f"user_version: {MigrationRunner(db).get_version()}")
+
+    for name, result in verify_query_plans(db).items():
+        status = "OK" if result['uses_index'] else "SCAN"
+        print(f"[{status}] {name}: {' | '.join(result['plan'])}")
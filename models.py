@@ -0,0 +1,106 @@
+from typing import NamedTuple, Optional
+
+# Spacing between anime_parts.position values, so a part can be inserted or
+# moved between two neighbours without renumbering the rest of the series.
+PART_POSITION_GAP = 1024
+
+class Record:
+    """Mixin for tuple-backed rows that can still be read like dicts.
+
+    Records are immutable tuples with ``__slots__ = ()``, so a row costs one
+    tuple instead of a ``sqlite3.Row`` plus a ``dict`` copy. ``record['code']``,
+    ``record.get('code')`` and ``dict(record)`` keep working for existing
+    callers. Queries must select ``cls.columns()`` so the positions match.
+    """
+
+    __slots__ = ()
+    _index = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._index = {name: position for position, name in enumerate(cls._fields)}
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return tuple.__getitem__(self, self._index[key])
+        return tuple.__getitem__(self, key)
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def get(self, key, default=None):
+        position = self._index.get(key)
+        return default if position is None else tuple.__getitem__(self, position)
+
+    def keys(self):
+        return self._fields
+
+    def values(self):
+        return tuple(self)
+
+    def items(self):
+        return zip(self._fields, self)
+
+    def to_dict(self) -> dict:
+        return dict(zip(self._fields, self))
+
+    @classmethod
+    def columns(cls, alias: str = None) -> str:
+        prefix = f'{alias}.' if alias else ''
+        return ', '.join(f'{prefix}{name}' for name in cls._fields)
+
+    @classmethod
+    def row_factory(cls, cursor, row):
+        return tuple.__new__(cls, row)
+
+class _AnimeRow(NamedTuple):
+    id: int
+    code: int
+    description: Optional[str]
+    photo_id: Optional[str]
+    created_at: str
+    updated_at: str
+
+class Anime(Record, _AnimeRow):
+    __slots__ = ()
+
+class _AnimePartRow(NamedTuple):
+    id: int
+    anime_code: int
+    part_number: int
+    file_id: str
+    created_at: str
+
+class AnimePart(Record, _AnimePartRow):
+    __slots__ = ()
+
+class _UserRow(NamedTuple):
+    user_id: int
+    username: Optional[str]
+    first_name: Optional[str]
+    last_name: Optional[str]
+    created_at: str
+    last_seen: str
+
+class User(Record, _UserRow):
+    __slots__ = ()
+
+class _GroupRow(NamedTuple):
+    id: int
+    group_id: int
+    link: Optional[str]
+    name: str
+    created_at: str
+
+class Group(Record, _GroupRow):
+    __slots__ = ()
+
+class _ChannelRow(NamedTuple):
+    id: int
+    channel_id: str
+    link: Optional[str]
+    name: str
+    created_at: str
+
+class Channel(Record, _ChannelRow):
+    __slots__ = ()
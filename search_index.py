@@ -0,0 +1,128 @@
+import heapq
+import re
+import threading
+import unicodedata
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# Uzbek Cyrillic (plus the Russian letters seen in titles) to Uzbek Latin,
+# without the o'/g' apostrophes, which search keys drop anyway.
+_CYRILLIC_TO_LATIN = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'ё': 'yo', 'ж': 'j',
+    'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n',
+    'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u', 'ф': 'f',
+    'х': 'x', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'sh', 'ъ': '', 'ы': 'i',
+    'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya', 'ў': 'o', 'қ': 'q', 'ғ': 'g',
+    'ҳ': 'h',
+}
+_VOWELS = set('аеёиоуэюяўaeiou')
+# o' and g' are typed with any of these
+_APOSTROPHES = re.compile("['`\u00b4\u02b9\u02bb\u02bc\u02bd\u2018\u2019]")
+
+def _transliterate(text: str) -> str:
+    out = []
+    previous = ''
+    for char in text:
+        if char == 'е':
+            # Cyrillic е is "ye" at the start of a word and after a vowel
+            out.append('ye' if not previous.isalpha() or previous in _VOWELS or previous in 'ъь' else 'e')
+        else:
+            out.append(_CYRILLIC_TO_LATIN.get(char, char))
+        previous = char
+    return ''.join(out)
+
+def search_key(text: Optional[str]) -> str:
+    """Script-independent form of ``text`` used for every search lookup.
+
+    Case-folds, writes Uzbek Cyrillic in Latin, drops o'/g' apostrophes in
+    all their variants and strips diacritics, so "Ўзбек", "Oʻzbek" and
+    "o'zbek" all become ``ozbek``.
+    """
+    text = _transliterate(unicodedata.normalize('NFC', (text or '').casefold()))
+    text = ''.join(char for char in unicodedata.normalize('NFKD', text) if not unicodedata.combining(char))
+    return ' '.join(re.findall(r'\w+', _APOSTROPHES.sub('', text)))
+
+def trigrams(text: Optional[str]) -> Set[str]:
+    """Trigrams of every word, padded like pg_trgm so word starts weigh more."""
+    grams = set()
+    for word in search_key(text).split():
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+class TrigramIndex:
+    """In-memory trigram index over anime descriptions for typo-tolerant search.
+
+    A match scores the share of the query's trigrams found in the title, with
+    ties going to the shorter title. Query trigrams are looked up rarest first
+    and lookups stop after ``max_postings`` posting entries, so one search
+    costs a bounded amount of work however large the catalog grows.
+    """
+
+    def __init__(self, min_score: float = 0.3, max_postings: int = 100000):
+        self.min_score = min_score
+        self.max_postings = max_postings
+        self._postings: Dict[str, Set[int]] = {}
+        self._grams: Dict[int, Set[str]] = {}
+        self._lock = threading.Lock()
+        self.built = False
+
+    def __len__(self) -> int:
+        return len(self._grams)
+
+    def _remove(self, code: int):
+        for gram in self._grams.pop(code, ()):
+            codes = self._postings[gram]
+            codes.discard(code)
+            if not codes:
+                del self._postings[gram]
+
+    def build(self, items: Iterable[Tuple[int, Optional[str]]]):
+        postings, grams_by_code = {}, {}
+        for code, description in items:
+            grams = trigrams(description)
+            grams_by_code[code] = grams
+            for gram in grams:
+                postings.setdefault(gram, set()).add(code)
+
+        with self._lock:
+            self._postings, self._grams = postings, grams_by_code
+            self.built = True
+
+    def update(self, code: int, description: Optional[str]):
+        grams = trigrams(description)
+        with self._lock:
+            self._remove(code)
+            self._grams[code] = grams
+            for gram in grams:
+                self._postings.setdefault(gram, set()).add(code)
+
+    def remove(self, code: int):
+        with self._lock:
+            self._remove(code)
+
+    def search(self, query: str, limit: int = 10) -> List[Tuple[int, float]]:
+        """Up to ``limit`` ``(code, score)`` pairs, best first."""
+        query_grams = trigrams(query)
+        if not query_grams:
+            return []
+
+        with self._lock:
+            postings = sorted((self._postings.get(gram, ()) for gram in query_grams), key=len)
+            overlap = Counter()
+            budget = self.max_postings
+            for codes in postings:
+                if not codes:
+                    continue
+                if budget <= 0:
+                    break
+                overlap.update(codes)
+                budget -= len(codes)
+
+            scored = (
+                (count / len(query_grams), -len(self._grams[code]), code)
+                for code, count in overlap.items()
+            )
+            best = heapq.nlargest(limit, (item for item in scored if item[0] >= self.min_score))
+
+        return [(code, score) for score, _, code in best]
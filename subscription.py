@@ -0,0 +1,138 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional, Union
+from cache import LRUCache, SingleFlight
+from config import (
+    MEMBERSHIP_CACHE_SIZE, MEMBERSHIP_MEMBER_TTL, MEMBERSHIP_NOT_MEMBER_TTL, MEMBERSHIP_STORE_TTL,
+    SUBSCRIPTION_CHECK_TIMEOUT, SUBSCRIPTION_FAIL_OPEN
+)
+
+logger = logging.getLogger(__name__)
+
+MEMBER_STATUSES = ('member', 'administrator', 'creator')
+
+def normalize_channel_id(channel_id) -> Union[int, str]:
+    try:
+        return int(channel_id)
+    except (ValueError, TypeError):
+        return channel_id
+
+def matches_chat(channel_id, chat) -> bool:
+    """Whether a mandatory channel entry (numeric id or ``@username``) is ``chat``."""
+    channel_id = normalize_channel_id(channel_id)
+    if isinstance(channel_id, int):
+        return channel_id == chat.id
+    return bool(chat.username) and str(channel_id).lstrip('@').lower() == chat.username.lower()
+
+class SubscriptionGate:
+    """Mandatory-channel check shared by every handler that gates on it.
+
+    Answers come from, in order: an in-memory cache keyed by (user,
+    channel), the ``channel_members`` table of the attached store, which
+    ``chat_member`` updates keep current, and only then ``get_chat_member``.
+    API answers are written back to the store and trusted for ``store_ttl``
+    seconds, or ``MEMBERSHIP_NOT_MEMBER_TTL`` for "not a member"; rows from ``chat_member`` updates are trusted until the next
+    update, since Telegram only sends those for channels where the bot is
+    an admin.
+
+    API calls for all unknown channels run concurrently, each with its own
+    ``timeout``. A channel that errors or times out counts as subscribed
+    when ``fail_open`` is set and as not subscribed otherwise; such answers
+    are never cached.
+
+    Concurrent checks for the same user and channel list, e.g. a burst of
+    messages or a double-tapped button, share one run.
+    """
+
+    def __init__(self, timeout: float = SUBSCRIPTION_CHECK_TIMEOUT, fail_open: bool = SUBSCRIPTION_FAIL_OPEN,
+                 cache: LRUCache = None, store=None, store_ttl: float = MEMBERSHIP_STORE_TTL):
+        self.timeout = timeout
+        self.fail_open = fail_open
+        self.cache = cache or LRUCache(MEMBERSHIP_CACHE_SIZE, MEMBERSHIP_MEMBER_TTL)
+        self.store = store
+        self.store_ttl = store_ttl
+        self.api_calls = 0
+        self.local_hits = 0
+        self.failures = 0
+        self.flights = SingleFlight('subscription')
+
+    def attach_store(self, store):
+        """``store`` is an ``AsyncDatabase``."""
+        self.store = store
+
+    def _remember(self, user_id: int, channel_id: str, subscribed: bool):
+        self.cache.put((user_id, channel_id), subscribed,
+                       ttl=MEMBERSHIP_MEMBER_TTL if subscribed else MEMBERSHIP_NOT_MEMBER_TTL)
+
+    async def _ask(self, bot, channel_id: str, user_id: int) -> Optional[bool]:
+        self.api_calls += 1
+        try:
+            member = await asyncio.wait_for(
+                bot.get_chat_member(normalize_channel_id(channel_id), user_id), self.timeout
+            )
+        except Exception as e:
+            self.failures += 1
+            logger.warning(f"Obuna tekshiruvi xatosi ({channel_id}): {e!r}")
+            return None
+        return member.status in MEMBER_STATUSES
+
+    async def missing_channels(self, bot, channels: List, user_id: int, use_cache: bool = True) -> List:
+        """Channels from ``channels`` the user is not subscribed to, in order.
+
+        ``use_cache=False`` is for the explicit "check" button: Telegram is
+        asked directly and the answers replace what was stored.
+        """
+        key = (user_id, tuple(str(channel['channel_id']) for channel in channels), use_cache)
+        missing = await self.flights.run(key, lambda: self._missing_channels(bot, channels, user_id, use_cache))
+        return list(missing)
+
+    async def _missing_channels(self, bot, channels: List, user_id: int, use_cache: bool) -> List:
+        answers = {}
+
+        if use_cache:
+            for channel in channels:
+                cached = self.cache.get((user_id, str(channel['channel_id'])))
+                if cached is not None:
+                    answers[str(channel['channel_id'])] = cached
+
+            unknown = [str(channel['channel_id']) for channel in channels if str(channel['channel_id']) not in answers]
+            if unknown and self.store is not None:
+                for channel_id, subscribed in (await self.store.get_channel_memberships(
+                        user_id, unknown, api_max_age=self.store_ttl,
+                        api_not_member_max_age=MEMBERSHIP_NOT_MEMBER_TTL)).items():
+                    self.local_hits += 1
+                    answers[channel_id] = subscribed
+                    self._remember(user_id, channel_id, subscribed)
+
+        unknown = [str(channel['channel_id']) for channel in channels if str(channel['channel_id']) not in answers]
+        results = await asyncio.gather(*(self._ask(bot, channel_id, user_id) for channel_id in unknown))
+
+        fresh = []
+        for channel_id, subscribed in zip(unknown, results):
+            if subscribed is None:
+                answers[channel_id] = self.fail_open
+                continue
+            answers[channel_id] = subscribed
+            self._remember(user_id, channel_id, subscribed)
+            fresh.append((user_id, channel_id, subscribed))
+
+        if fresh and self.store is not None:
+            await self.store.set_channel_members(fresh)
+
+        return [channel for channel in channels if not answers[str(channel['channel_id'])]]
+
+    async def record(self, user_id: int, channel_id, subscribed: bool):
+        """Store a join or leave seen in a ``chat_member`` update."""
+        self._remember(user_id, str(channel_id), subscribed)
+        if self.store is not None:
+            await self.store.set_channel_members([(user_id, str(channel_id), subscribed)], source='update')
+
+    def stats(self) -> Dict:
+        return {**self.cache.stats(), 'local_hits': self.local_hits,
+                'api_calls': self.api_calls, 'failures': self.failures,
+                'coalesced': self.flights.coalesced}
+
+subscription_gate = SubscriptionGate()
+
+def get_membership_stats() -> Dict:
+    return subscription_gate.stats()
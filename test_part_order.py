@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import os
+import sys
+import tempfile
+
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+from database import Database
+from models import PART_POSITION_GAP
+
+failed = 0
+
+def check(name, actual, expected):
+    global failed
+    if actual == expected:
+        print(f"[OK] {name}")
+    else:
+        failed += 1
+        print(f"[ERROR] {name}: {actual} != {expected}")
+
+def order(db, code):
+    return [part['file_id'] for part in db.get_anime_parts(code)]
+
+tmp = tempfile.TemporaryDirectory()
+db = Database(os.path.join(tmp.name, 'parts.db'), write_behind=False)
+db.add_anime(1, 'Part order', 'photo')
+
+print("[*] Insert...")
+for number, file_id in enumerate(['a', 'b', 'c'], 1):
+    db.add_anime_part(1, number, file_id)
+check("append", order(db, 1), ['a', 'b', 'c'])
+db.add_anime_part(1, 1, 'first')
+check("insert at 1", order(db, 1), ['first', 'a', 'b', 'c'])
+db.add_anime_part(1, 3, 'middle')
+check("insert at 3", order(db, 1), ['first', 'a', 'middle', 'b', 'c'])
+db.add_anime_part(1, 99, 'last')
+check("insert past the end", order(db, 1), ['first', 'a', 'middle', 'b', 'c', 'last'])
+check("displayed numbers", [part['part_number'] for part in db.get_anime_parts(1)], [1, 2, 3, 4, 5, 6])
+check("get_anime_part", db.get_anime_part(1, 3)['file_id'], 'middle')
+
+print("[*] Delete...")
+db.delete_anime_part(1, 1)
+check("delete 1", order(db, 1), ['a', 'middle', 'b', 'c', 'last'])
+db.delete_anime_part(1, 3)
+check("delete 3", order(db, 1), ['a', 'middle', 'c', 'last'])
+
+print("[*] Move...")
+db.move_anime_part(1, 4, 1)
+check("move 4 -> 1", order(db, 1), ['last', 'a', 'middle', 'c'])
+db.move_anime_part(1, 1, 4)
+check("move 1 -> 4", order(db, 1), ['a', 'middle', 'c', 'last'])
+db.move_anime_part(1, 2, 3)
+check("move 2 -> 3", order(db, 1), ['a', 'c', 'middle', 'last'])
+
+print("[*] Rebalance...")
+for _ in range(12):
+    # Always between slots 1 and 2 halves the gap until it runs out
+    db.add_anime_part(1, 2, 'squeezed')
+parts = order(db, 1)
+check("squeezed order", (parts[0], parts[1:13], parts[13:]), ('a', ['squeezed'] * 12, ['c', 'middle', 'last']))
+with db.pool.connection() as conn:
+    positions = [row[0] for row in conn.execute(
+        'SELECT position FROM anime_parts WHERE anime_code = 1 ORDER BY position, id'
+    )]
+check("positions unique", len(set(positions)), len(positions))
+
+print("[*] Bulk...")
+db.add_anime(2, 'Bulk', 'photo')
+db.add_anime_part(2, 1, 'x1')
+db.add_anime_part(2, 2, 'x2')
+db.add_anime_part(2, 3, 'x3')
+db.delete_anime_part(2, 1)
+results = db.add_anime_parts_bulk([{'anime_code': 2, 'part_number': 3, 'file_id': 'x4'}])
+check("bulk after delete", (results[0]['ok'], order(db, 2)), (True, ['x2', 'x3', 'x4']))
+db.add_anime_bulk([{'code': 3, 'parts': [{'part_number': 2, 'file_id': 'y2'}, {'part_number': 1, 'file_id': 'y1'}]}])
+check("bulk new anime", order(db, 3), ['y1', 'y2'])
+check("gap", PART_POSITION_GAP > 1, True)
+
+db.close()
+tmp.cleanup()
+
+print()
+if failed:
+    print(f"[ERROR] {failed} check(s) failed")
+    sys.exit(1)
+print("[OK] Part ordering checks passed!")
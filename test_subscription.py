@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import types
+
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+import cache
+from database import AsyncDatabase, Database
+from subscription import SubscriptionGate
+
+failed = 0
+
+def check(name, actual, expected):
+    global failed
+    if actual == expected:
+        print(f"[OK] {name}")
+    else:
+        failed += 1
+        print(f"[ERROR] {name}: {actual} != {expected}")
+
+class FakeBot:
+    def __init__(self):
+        self.status = 'left'
+        self.calls = 0
+
+    async def get_chat_member(self, chat_id, user_id):
+        self.calls += 1
+        return types.SimpleNamespace(status=self.status)
+
+# Moves the in-memory cache clock; stored rows are aged with backdate()
+offset = 0.0
+cache.time = types.SimpleNamespace(monotonic=lambda: time.monotonic() + offset)
+
+def advance(seconds):
+    global offset
+    offset += seconds
+    with db.pool.connection() as conn:
+        conn.execute("UPDATE channel_members SET updated_at = datetime(updated_at, ?)", (f'-{int(seconds)} seconds',))
+        conn.commit()
+
+tmp = tempfile.TemporaryDirectory()
+db = Database(os.path.join(tmp.name, 'members.db'), write_behind=False)
+store = AsyncDatabase(db)
+bot = FakeBot()
+channels = [{'channel_id': '-1001'}]
+
+async def missing():
+    return [channel['channel_id'] for channel in await gate.missing_channels(bot, channels, 42)]
+
+async def main():
+    global gate
+    gate = SubscriptionGate(store=store)
+
+    print("[*] Not subscribed...")
+    check("refused", await missing(), ['-1001'])
+    check("asked once", bot.calls, 1)
+    check("cached", (await missing(), bot.calls), (['-1001'], 1))
+
+    print("[*] Joins without a chat_member update...")
+    bot.status = 'member'
+    advance(31)
+    check("asked again after 30 s", (await missing(), bot.calls), ([], 2))
+
+    print("[*] Subscribed answer is kept...")
+    advance(3600)
+    check("trusted from the store", (await missing(), bot.calls), ([], 2))
+    advance(86400)
+    check("asked again after a day", (await missing(), bot.calls), ([], 3))
+
+    print("[*] chat_member updates...")
+    await gate.record(42, '-1001', False)
+    advance(86400 * 7)
+    check("update rows never expire", (await missing(), bot.calls), (['-1001'], 3))
+
+asyncio.run(main())
+store.close()
+tmp.cleanup()
+
+print()
+if failed:
+    print(f"[ERROR] {failed} check(s) failed")
+    sys.exit(1)
+print("[OK] Subscription store checks passed!")
@@ -83,6 +83,14 @@ Kerakli amalni tanlang:
 • /top - Eng ko'p ko'rilgan
 """
     
+    @staticmethod
+    def format_snapshot_age(seconds: float) -> str:
+        if seconds < 60:
+            return "🕐 Ma'lumotlar: hozirgi holat"
+        if seconds < 3600:
+            return f"🕐 Ma'lumotlar: {int(seconds // 60)} daqiqa oldingi holat"
+        return f"🕐 Ma'lumotlar: {int(seconds // 3600)} soat oldingi holat"
+    
     @staticmethod
     def format_anime_card(anime_data: dict) -> str:
         text = f"""